@@ -0,0 +1,191 @@
+# agents/_llm_cache.py
+# An exact-match response cache for the deterministic (temperature=0) parser chains.
+# Identical prompts (retries, re-prompts, repeated test runs) are answered locally
+# instead of paying for another LLM round-trip.
+
+import contextvars
+import copy
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Optional, Protocol
+
+from langchain_core.runnables import RunnableLambda
+
+from config import settings
+
+
+class CacheBackend(Protocol):
+    """Minimal interface every cache backend implements."""
+
+    def get(self, key: str) -> Optional[Any]:
+        ...
+
+    def set(self, key: str, value: Any) -> None:
+        ...
+
+
+class InMemoryCache:
+    """An LRU cache with a per-entry TTL, backed by an OrderedDict."""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class RedisCache:
+    """A shared cache for multi-process deployments. Requires the `redis` package."""
+
+    def __init__(self, url: str, ttl_seconds: int = 3600, prefix: str = "llm-cache:"):
+        import redis  # Optional dependency, only needed when LLM_CACHE_REDIS_URL is set.
+
+        self._client = redis.Redis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self._client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any) -> None:
+        self._client.set(self.prefix + key, json.dumps(value), ex=self.ttl_seconds)
+
+
+class SQLiteCache:
+    """A persistent single-machine cache, so repeated prompts survive restarts."""
+
+    def __init__(self, database_path: str, ttl_seconds: int = 7 * 24 * 3600):
+        self.ttl_seconds = ttl_seconds
+        # One connection shared by every thread; the lock serializes access to it.
+        self._conn = sqlite3.connect(database_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM llm_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + self.ttl_seconds),
+            )
+
+
+def _create_default_cache() -> CacheBackend:
+    if settings.LLM_CACHE_REDIS_URL:
+        try:
+            return RedisCache(settings.LLM_CACHE_REDIS_URL)
+        except Exception as e:
+            print(f"⚠️ Could not connect to Redis cache, falling back to a local cache: {e}")
+    if settings.LLM_CACHE_SQLITE_PATH:
+        try:
+            return SQLiteCache(settings.LLM_CACHE_SQLITE_PATH)
+        except Exception as e:
+            print(f"⚠️ Could not open SQLite cache, falling back to in-memory cache: {e}")
+    return InMemoryCache()
+
+
+# Shared by all chains in the process.
+response_cache: CacheBackend = _create_default_cache()
+
+
+def cache_key(model: str, system_prompt: str, conversation_history: Any) -> str:
+    """Builds a stable key from everything that determines the LLM response."""
+    payload = json.dumps(
+        {"model": model, "system_prompt": system_prompt, "conversation_history": conversation_history},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Set by bypass_response_cache(); tasks started inside it inherit the value.
+_bypass = contextvars.ContextVar("llm_response_cache_bypass", default=False)
+
+
+@contextmanager
+def bypass_response_cache():
+    """Within this block (and tasks started in it) every call goes to the LLM, e.g. for benchmarks."""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def with_response_cache(
+    chain,
+    llm,
+    system_prompt: str,
+    cache: Optional[CacheBackend] = None,
+    normalize: Optional[Callable[[Any], Any]] = None,
+):
+    """
+    Wraps a chain so repeated inputs are served from the cache.
+
+    Only deterministic LLMs (temperature == 0) are cached; otherwise the chain is
+    returned unchanged. `normalize` maps the inputs to the value used in the cache
+    key, so trivially different inputs (case, spacing) share one entry.
+    """
+    if getattr(llm, "temperature", None) != 0:
+        return chain
+
+    cache = cache or response_cache
+    model = getattr(llm, "model_name", None) or ""
+
+    def _key(inputs) -> str:
+        return cache_key(model, system_prompt, normalize(inputs) if normalize else inputs)
+
+    def _invoke(inputs, config):
+        if _bypass.get():
+            return chain.invoke(inputs, config)
+        key = _key(inputs)
+        cached = cache.get(key)
+        if cached is not None:
+            return copy.deepcopy(cached)
+        result = chain.invoke(inputs, config)
+        cache.set(key, result)
+        return copy.deepcopy(result)
+
+    async def _ainvoke(inputs, config):
+        if _bypass.get():
+            return await chain.ainvoke(inputs, config)
+        key = _key(inputs)
+        cached = cache.get(key)
+        if cached is not None:
+            return copy.deepcopy(cached)
+        result = await chain.ainvoke(inputs, config)
+        cache.set(key, result)
+        return copy.deepcopy(result)
+
+    return RunnableLambda(_invoke, afunc=_ainvoke)
@@ -0,0 +1,70 @@
+# agents/_prompt_cache.py
+# Helpers that let the LLM provider cache the static prefix of our agent prompts.
+# Every chain sends [master prompt + agent instructions] first and the
+# conversation history last, so the prefix is byte-identical between calls.
+
+import functools
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableLambda
+
+HISTORY_PREFIX = "Here is the conversation history:\n\n"
+
+
+def _is_anthropic_model(llm) -> bool:
+    """Anthropic models only cache blocks that carry an explicit breakpoint."""
+    model_name = (getattr(llm, "model_name", None) or "").lower()
+    return model_name.startswith("anthropic/") or "claude" in model_name
+
+
+def build_cached_system_message(llm, static_text: str) -> SystemMessage:
+    """
+    Builds the static system message for an agent chain.
+
+    OpenAI-compatible providers cache identical prefixes automatically. For
+    Anthropic models (via OpenRouter) we mark the block with `cache_control`.
+    """
+    if _is_anthropic_model(llm):
+        return SystemMessage(content=[{
+            "type": "text",
+            "text": static_text,
+            "cache_control": {"type": "ephemeral"},
+        }])
+    return SystemMessage(content=static_text)
+
+
+def history_prompt(system_message: SystemMessage):
+    """
+    Builds [system, human(history)] directly from `{"conversation_history": ...}`.
+
+    Only the history changes between calls, so this skips ChatPromptTemplate's
+    variable extraction and message rendering on every invoke.
+    """
+    def _to_messages(inputs):
+        return [system_message, HumanMessage(content=HISTORY_PREFIX + inputs["conversation_history"])]
+
+    return RunnableLambda(_to_messages)
+
+
+def memoize_chain(build_chain, maxsize: int = 4):
+    """
+    Memoizes a `create_*_chain(llm, master_prompt)` factory on (id(llm), master_prompt).
+
+    Calling the factory per request then returns the same compiled chain (and
+    the same byte-identical system prompt) instead of rebuilding it. The llm is
+    kept in the entry so its id cannot be reused while the entry is alive.
+    """
+    built = {}
+
+    @functools.wraps(build_chain)
+    def wrapper(llm, master_prompt: str):
+        key = (id(llm), master_prompt)
+        entry = built.get(key)
+        if entry is None:
+            if len(built) >= maxsize:
+                built.pop(next(iter(built)))
+            entry = built[key] = (llm, build_chain(llm, master_prompt))
+        return entry[1]
+
+    wrapper.cache_clear = built.clear
+    return wrapper
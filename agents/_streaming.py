@@ -0,0 +1,102 @@
+# agents/_streaming.py
+# Streams a JSON-mode LLM response and stops reading as soon as every field we
+# need has been generated, instead of waiting for the full response.
+
+from typing import Any, Dict, Optional, Sequence
+
+import orjson
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.runnables import RunnableLambda
+
+
+def json_schema_response_format(name: str, fields: Sequence[str]) -> Dict[str, Any]:
+    """
+    Builds a strict Structured Outputs `response_format` for an object whose
+    fields are all nullable strings, so the provider's constrained decoder
+    returns exactly these keys.
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": name,
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {field: {"type": ["string", "null"]} for field in fields},
+                "required": list(fields),
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+class FastJsonOutputParser(JsonOutputParser):
+    """
+    A JsonOutputParser that parses plain JSON with orjson and only falls back to
+    LangChain's markdown-tolerant parser when that fails.
+    """
+
+    def parse(self, text: str) -> Any:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            return super().parse(text)
+
+
+def _completed_fields(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns the fields parsed so far if the text is a JSON object whose last value
+    is complete (so closing the object yields valid JSON), otherwise None.
+    A trailing number only counts once a `,` or `}` follows it, since `1` may
+    still be the start of `12`.
+    """
+    candidate = text.strip()
+    if not candidate.startswith("{"):
+        return None
+    if not candidate.endswith("}"):
+        if not candidate.endswith(",") and candidate[-1].isdigit():
+            return None
+        candidate = candidate.rstrip(",") + "}"
+    try:
+        fields = orjson.loads(candidate)
+    except orjson.JSONDecodeError:
+        return None
+    return fields if isinstance(fields, dict) else None
+
+
+def stream_json_until(json_llm, required_keys: Sequence[str]):
+    """
+    Builds a runnable that streams `json_llm` and returns the parsed JSON object as
+    soon as all `required_keys` have complete values, closing the stream early.
+    Falls back to a full parse when the keys never all appear.
+    """
+    parser = FastJsonOutputParser()
+    required = frozenset(required_keys)
+
+    def _stream(prompt_value, config):
+        text = ""
+        stream = json_llm.stream(prompt_value, config)
+        try:
+            for chunk in stream:
+                text += chunk.content
+                fields = _completed_fields(text)
+                if fields is not None and required.issubset(fields):
+                    return fields
+        finally:
+            stream.close()
+        return parser.parse(text)
+
+    async def _astream(prompt_value, config):
+        text = ""
+        stream = json_llm.astream(prompt_value, config)
+        try:
+            async for chunk in stream:
+                text += chunk.content
+                fields = _completed_fields(text)
+                if fields is not None and required.issubset(fields):
+                    return fields
+        finally:
+            await stream.aclose()
+        return parser.parse(text)
+
+    return RunnableLambda(_stream, afunc=_astream)
@@ -2,246 +2,135 @@
 # This agent is responsible for processing the initial user input to extract
 # the patient's name, date of birth, doctor preference, and location.
 
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain_openai import ChatOpenAI
-from langchain_core.output_parsers import JsonOutputParser
-from typing import List, Dict, Any
+from pydantic import TypeAdapter, ValidationError
+from openai import RateLimitError
+from typing import List, Dict, Any, NamedTuple, TYPE_CHECKING
 
 # This top-level import is fine as it's a standard library
+import asyncio
 import sys
 import os
 
+# --- FIX FOR DIRECT EXECUTION ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+# --- END FIX ---
+
+from agents._llm_cache import with_response_cache
+from agents._prompt_cache import build_cached_system_message, history_prompt, memoize_chain
+from agents._streaming import json_schema_response_format, stream_json_until
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI  # Annotations only; main_graph builds the LLM.
+
 # --- 1. Define the Desired Output Structure ---
-class PatientInfo(BaseModel):
+# A NamedTuple keeps each instance as small as a plain tuple; validation happens
+# once in normalize_and_validate_patient_info via the adapter below.
+class PatientInfo(NamedTuple):
     """Data model for extracted patient information."""
-    full_name: str | None = Field(None)
-    date_of_birth: str | None = Field(None)
-    preferred_doctor: str | None = Field(None)
-    preferred_location: str | None = Field(None)
+    full_name: str | None = None
+    date_of_birth: str | None = None
+    preferred_doctor: str | None = None
+    preferred_location: str | None = None
+
+# Built once; reuses the compiled pydantic-core validator on every call.
+_PATIENT_ADAPTER = TypeAdapter(PatientInfo)
 
 # --- 2. Create the Agent Logic ---
-def create_greeting_chain(llm: ChatOpenAI, master_prompt: str):
-    """
-    Creates a LangChain chain that extracts patient info from a conversation using JSON Mode.
-    """
-    # We will use a simple JSON parser first, then validate with Pydantic.
-    parser = JsonOutputParser()
-    
-    json_llm = llm.bind(response_format={"type": "json_object"})
-    
-    system_prompt = master_prompt + """
+# Static instructions live at module level so the system prompt is byte-identical
+# on every call; this is what lets the provider cache the prompt prefix.
+STATIC_GREETING_SYSTEM = """
     You are the 'Greeting Agent'. Your task is to analyze the user's message and extract their full name, date of birth, preferred doctor, and preferred location.
 
-    - Use "fullName", "dateOfBirth", "preferredDoctor", and "preferredLocation" as the keys in your JSON response.
     - If the user provides their name, extract it exactly as provided.
     - If the user provides their date of birth, format it as YYYY-MM-DD.
     - If the user mentions a doctor preference, extract it.
     - If the user mentions a location preference, extract it.
     - If any piece of information is missing, you MUST return null for that field.
+    - Use exactly these keys: "full_name", "date_of_birth", "preferred_doctor", "preferred_location".
     - You MUST ONLY respond with a valid JSON object. Do not add any other text or explanations.
-
-    Example Response: {{"fullName": "Jane Doe", "dateOfBirth": "1985-03-15", "preferredDoctor": "Dr. Smith", "preferredLocation": "Downtown Clinic"}}
     """
 
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", system_prompt),
-        ("human", "Here is the conversation history:\n\n{conversation_history}")
-    ])
-        
-    return prompt | json_llm | parser
-
-# --- 3. Helper function to normalize LLM output ---
-def normalize_and_validate_patient_info(data: Dict[str, Any]) -> PatientInfo:
-    """
-    Takes the raw dict from the LLM and normalizes its keys before validating with Pydantic.
-    This makes our code resilient to the LLM's inconsistent key naming.
-    """
-    # Normalize keys: check for common variations and map them to our Pydantic model's fields.
-    normalized_data = {
-        'full_name': data.get('fullName') or data.get('full_name') or data.get('name'),
-        'date_of_birth': data.get('dateOfBirth') or data.get('date_of_birth') or data.get('dob'),
-        'preferred_doctor': data.get('preferredDoctor') or data.get('preferred_doctor') or data.get('doctor'),
-        'preferred_location': data.get('preferredLocation') or data.get('preferred_location') or data.get('location')
-    }
-    # Create and validate the Pydantic model
-    return PatientInfo(**normalized_data)
-
-def format_patient_info_for_confirmation(patient_info: PatientInfo) -> str:
-    """
-    Formats the patient information for confirmation display.
-    """
-    info_lines = []
-    if patient_info.full_name:
-        info_lines.append(f"**Name:** {patient_info.full_name}")
-    if patient_info.date_of_birth:
-        info_lines.append(f"**Date of Birth:** {patient_info.date_of_birth}")
-    if patient_info.preferred_doctor:
-        info_lines.append(f"**Preferred Doctor:** {patient_info.preferred_doctor}")
-    if patient_info.preferred_location:
-        info_lines.append(f"**Preferred Location:** {patient_info.preferred_location}")
-    
-    return "\n".join(info_lines)
+# The response schema is enforced by providers that support Structured Outputs;
+# the key hint in the prompt covers the ones that ignore it.
+GREETING_RESPONSE_FORMAT = json_schema_response_format("patient_info", PatientInfo._fields)
 
-def get_missing_info_message(patient_info: PatientInfo) -> str:
+@memoize_chain
+def create_greeting_chain(llm: "ChatOpenAI", master_prompt: str):
     """
-    Returns a message asking for missing information.
+    Creates a LangChain chain that extracts patient info from a conversation using Structured Outputs.
     """
-    missing_fields = []
-    if not patient_info.full_name:
-        missing_fields.append("your full name")
-    if not patient_info.date_of_birth:
-        missing_fields.append("your date of birth")
-    if not patient_info.preferred_doctor:
-        missing_fields.append("your preferred doctor")
-    if not patient_info.preferred_location:
-        missing_fields.append("your preferred location")
+    json_llm = llm.bind(response_format=GREETING_RESPONSE_FORMAT)
     
-    if len(missing_fields) == 0:
-        return None
-    elif len(missing_fields) == 1:
-        return f"I still need {missing_fields[0]}. Could you please provide that information?"
-    elif len(missing_fields) == 2:
-        return f"I still need {missing_fields[0]} and {missing_fields[1]}. Could you please provide that information?"
-    else:
-        missing_str = ", ".join(missing_fields[:-1]) + f", and {missing_fields[-1]}"
-        return f"I still need {missing_str}. Could you please provide that information?"
+    # All static content goes first (cacheable prefix), the conversation history last.
+    system_prompt = master_prompt + STATIC_GREETING_SYSTEM
+    system_message = build_cached_system_message(llm, system_prompt)
 
-def is_patient_info_complete(patient_info: PatientInfo) -> bool:
-    """
-    Checks if all required patient information is provided.
-    """
-    return all([
-        patient_info.full_name,
-        patient_info.date_of_birth,
-        patient_info.preferred_doctor,
-        patient_info.preferred_location
-    ])
+    prompt = history_prompt(system_message)
 
-# --- 4. Example Usage & Testing ---
-if __name__ == '__main__':
-    # --- FIX FOR DIRECT EXECUTION ---
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.dirname(current_dir)
-    sys.path.append(project_root)
-    # --- END FIX ---
-    
-    # --- LOCAL IMPORTS ---
-    from config import prompts
-    from main_graph import llm 
-    # --- END LOCAL IMPORTS ---
+    # Stream the response and stop as soon as every key has a complete value.
+    chain = prompt | stream_json_until(json_llm, PatientInfo._fields)
+    # Identical conversation histories are answered from the response cache.
+    return with_response_cache(chain, llm, system_prompt)
 
-    print("🚀 Testing Greeting Agent...")
-
-    greeting_agent = create_greeting_chain(llm, prompts.MASTER_PROMPT)
-
-    # --- Test Case 1: All information provided ---
-    print("\n--- Test Case 1: Full Info ---")
-    messages = [{"role": "user", "content": "Hi, I'd like to book an appointment. My name is Jane Doe, I was born on March 15, 1985, I'd like to see Dr. Smith at the Downtown Clinic."}]
-    history = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
-    
-    result_dict = greeting_agent.invoke({"conversation_history": history})
-    patient_info = normalize_and_validate_patient_info(result_dict)
-    
-    print("Validated Info:", patient_info)
-    print("Is Complete:", is_patient_info_complete(patient_info))
-    print("Formatted for confirmation:", format_patient_info_for_confirmation(patient_info))
-    print("✅ Test Case 1 Passed")
-
-    # --- Test Case 2: Partial information ---
-    print("\n--- Test Case 2: Partial Info ---")
-    messages = [{"role": "user", "content": "Hello, my name is John Smith and I was born on June 10, 1990."}]
-    history = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
-
-    result_dict = greeting_agent.invoke({"conversation_history": history})
-    patient_info = normalize_and_validate_patient_info(result_dict)
-    
-    print("Validated Info:", patient_info)
-    print("Is Complete:", is_patient_info_complete(patient_info))
-    print("Missing info message:", get_missing_info_message(patient_info))
-    print("✅ Test Case 2 Passed")
-
-    # --- Test Case 3: No information ---
-    print("\n--- Test Case 3: No Info ---")
-    messages = [{"role": "user", "content": "Hi there!"}]
-    history = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
-
-    result_dict = greeting_agent.invoke({"conversation_history": history})
-    patient_info = normalize_and_validate_patient_info(result_dict)
-    
-    print("Validated Info:", patient_info)
-    print("Is Complete:", is_patient_info_complete(patient_info))
-    print("Missing info message:", get_missing_info_message(patient_info))
-    print("✅ Test Case 3 Passed")
-
-    print("\n🎉 Greeting Agent tests completed successfully!")# agents/greeting_agent.py
-# This agent is responsible for processing the initial user input to extract
-# the patient's name, date of birth, doctor preference, and location.
-
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain_openai import ChatOpenAI
-from langchain_core.output_parsers import JsonOutputParser
-from typing import List, Dict, Any
-
-# This top-level import is fine as it's a standard library
-import sys
-import os
-
-# --- 1. Define the Desired Output Structure ---
-class PatientInfo(BaseModel):
-    """Data model for extracted patient information."""
-    full_name: str | None = Field(None)
-    date_of_birth: str | None = Field(None)
-    preferred_doctor: str | None = Field(None)
-    preferred_location: str | None = Field(None)
+# --- 3. Helper function to normalize LLM output ---
+# Every key spelling we've seen the LLM use, mapped to our model's fields. Still
+# needed for providers that silently ignore the response schema.
+_PATIENT_FIELD_ALIASES = {
+    'fullName': 'full_name', 'full_name': 'full_name', 'name': 'full_name',
+    'dateOfBirth': 'date_of_birth', 'date_of_birth': 'date_of_birth', 'dob': 'date_of_birth',
+    'preferredDoctor': 'preferred_doctor', 'preferred_doctor': 'preferred_doctor', 'doctor': 'preferred_doctor',
+    'preferredLocation': 'preferred_location', 'preferred_location': 'preferred_location', 'location': 'preferred_location',
+}
+
+def _usable_strings(data: Dict[str, Any]) -> Dict[str, str]:
+    """Keeps string values, turns numbers into strings and drops anything else."""
+    return {
+        field: value if isinstance(value, str) else str(value)
+        for field, value in data.items()
+        if isinstance(value, (str, int, float)) and not isinstance(value, bool)
+    }
 
-# --- 2. Create the Agent Logic ---
-def create_greeting_chain(llm: ChatOpenAI, master_prompt: str):
+def normalize_and_validate_patient_info(data: Dict[str, Any]) -> PatientInfo:
     """
-    Creates a LangChain chain that extracts patient info from a conversation using JSON Mode.
+    Takes the raw dict from the LLM and normalizes its keys before validating it.
+    This makes our code resilient to the LLM's inconsistent key naming.
     """
-    # We will use a simple JSON parser first, then validate with Pydantic.
-    parser = JsonOutputParser()
-    
-    json_llm = llm.bind(response_format={"type": "json_object"})
-    
-    system_prompt = master_prompt + """
-    You are the 'Greeting Agent'. Your task is to analyze the user's message and extract their full name, date of birth, preferred doctor, and preferred location.
+    # Single pass over the LLM's keys, mapping each known spelling onto our field names.
+    normalized_data = {}
+    for key, value in data.items():
+        field = _PATIENT_FIELD_ALIASES.get(key)
+        if field and value and field not in normalized_data:
+            normalized_data[field] = value
+    # Validate with the prebuilt adapter
+    try:
+        return _PATIENT_ADAPTER.validate_python(normalized_data)
+    except ValidationError:
+        # Strict pydantic v2 rejects non-string values; keep what is usable.
+        return PatientInfo(**_usable_strings(normalized_data))
 
-    - Use "fullName", "dateOfBirth", "preferredDoctor", and "preferredLocation" as the keys in your JSON response.
-    - If the user provides their name, extract it exactly as provided.
-    - If the user provides their date of birth, format it as YYYY-MM-DD.
-    - If the user mentions a doctor preference, extract it.
-    - If the user mentions a location preference, extract it.
-    - If any piece of information is missing, you MUST return null for that field.
-    - You MUST ONLY respond with a valid JSON object. Do not add any other text or explanations.
+async def extract_many(greeting_chain, histories: List[str], max_concurrency: int = 16) -> List[PatientInfo]:
+    """
+    Extracts patient info from many conversation histories concurrently.
 
-    Example Response: {{"fullName": "Jane Doe", "dateOfBirth": "1985-03-15", "preferredDoctor": "Dr. Smith", "preferredLocation": "Downtown Clinic"}}
+    At most `max_concurrency` requests are in flight at once, and rate-limited
+    (429) requests are retried with exponential backoff.
     """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    retrying_chain = greeting_chain.with_retry(
+        retry_if_exception_type=(RateLimitError,),
+        wait_exponential_jitter=True,
+        stop_after_attempt=4,
+    )
 
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", system_prompt),
-        ("human", "Here is the conversation history:\n\n{conversation_history}")
-    ])
-        
-    return prompt | json_llm | parser
+    async def _extract(history: str) -> PatientInfo:
+        async with semaphore:
+            raw_info = await retrying_chain.ainvoke({"conversation_history": history})
+        return normalize_and_validate_patient_info(raw_info)
 
-# --- 3. Helper function to normalize LLM output ---
-def normalize_and_validate_patient_info(data: Dict[str, Any]) -> PatientInfo:
-    """
-    Takes the raw dict from the LLM and normalizes its keys before validating with Pydantic.
-    This makes our code resilient to the LLM's inconsistent key naming.
-    """
-    # Normalize keys: check for common variations and map them to our Pydantic model's fields.
-    normalized_data = {
-        'full_name': data.get('fullName') or data.get('full_name') or data.get('name'),
-        'date_of_birth': data.get('dateOfBirth') or data.get('date_of_birth') or data.get('dob'),
-        'preferred_doctor': data.get('preferredDoctor') or data.get('preferred_doctor') or data.get('doctor'),
-        'preferred_location': data.get('preferredLocation') or data.get('preferred_location') or data.get('location')
-    }
-    # Create and validate the Pydantic model
-    return PatientInfo(**normalized_data)
+    return await asyncio.gather(*(_extract(history) for history in histories))
 
 def format_patient_info_for_confirmation(patient_info: PatientInfo) -> str:
     """
@@ -259,95 +148,74 @@ def format_patient_info_for_confirmation(patient_info: PatientInfo) -> str:
     
     return "\n".join(info_lines)
 
+# (attribute, label) pairs in the order we ask for them.
+_MISSING_FIELD_LABELS = (
+    ('full_name', 'your full name'),
+    ('date_of_birth', 'your date of birth'),
+    ('preferred_doctor', 'your preferred doctor'),
+    ('preferred_location', 'your preferred location'),
+)
+
 def get_missing_info_message(patient_info: PatientInfo) -> str:
     """
     Returns a message asking for missing information.
     """
-    missing_fields = []
-    if not patient_info.full_name:
-        missing_fields.append("your full name")
-    if not patient_info.date_of_birth:
-        missing_fields.append("your date of birth")
-    if not patient_info.preferred_doctor:
-        missing_fields.append("your preferred doctor")
-    if not patient_info.preferred_location:
-        missing_fields.append("your preferred location")
-    
-    if len(missing_fields) == 0:
+    missing_fields = [label for attr, label in _MISSING_FIELD_LABELS if not getattr(patient_info, attr)]
+    if not missing_fields:
         return None
-    elif len(missing_fields) == 1:
-        return f"I still need {missing_fields[0]}. Could you please provide that information?"
-    elif len(missing_fields) == 2:
-        return f"I still need {missing_fields[0]} and {missing_fields[1]}. Could you please provide that information?"
+
+    # "a", "a and b", "a, b, and c"
+    if len(missing_fields) <= 2:
+        missing_str = " and ".join(missing_fields)
     else:
         missing_str = ", ".join(missing_fields[:-1]) + f", and {missing_fields[-1]}"
-        return f"I still need {missing_str}. Could you please provide that information?"
+    return f"I still need {missing_str}. Could you please provide that information?"
 
 def is_patient_info_complete(patient_info: PatientInfo) -> bool:
     """
     Checks if all required patient information is provided.
     """
-    return all([
-        patient_info.full_name,
-        patient_info.date_of_birth,
-        patient_info.preferred_doctor,
-        patient_info.preferred_location
-    ])
+    return all(patient_info)
 
 # --- 4. Example Usage & Testing ---
 if __name__ == '__main__':
-    # --- FIX FOR DIRECT EXECUTION ---
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.dirname(current_dir)
-    sys.path.append(project_root)
-    # --- END FIX ---
-    
     # --- LOCAL IMPORTS ---
     from config import prompts
-    from main_graph import llm 
+    # parser_llm's HTTP client is bound to main_graph's event loop, so the async
+    # calls below must run there (via run_async), not in a fresh asyncio.run() loop.
+    from main_graph import format_history, parser_llm as llm, run_async
     # --- END LOCAL IMPORTS ---
 
     print("🚀 Testing Greeting Agent...")
 
     greeting_agent = create_greeting_chain(llm, prompts.MASTER_PROMPT)
 
-    # --- Test Case 1: All information provided ---
-    print("\n--- Test Case 1: Full Info ---")
-    messages = [{"role": "user", "content": "Hi, I'd like to book an appointment. My name is Jane Doe, I was born on March 15, 1985, I'd like to see Dr. Smith at the Downtown Clinic."}]
-    history = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
-    
-    result_dict = greeting_agent.invoke({"conversation_history": history})
-    patient_info = normalize_and_validate_patient_info(result_dict)
-    
-    print("Validated Info:", patient_info)
-    print("Is Complete:", is_patient_info_complete(patient_info))
-    print("Formatted for confirmation:", format_patient_info_for_confirmation(patient_info))
-    print("✅ Test Case 1 Passed")
-
-    # --- Test Case 2: Partial information ---
-    print("\n--- Test Case 2: Partial Info ---")
-    messages = [{"role": "user", "content": "Hello, my name is John Smith and I was born on June 10, 1990."}]
-    history = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
-
-    result_dict = greeting_agent.invoke({"conversation_history": history})
-    patient_info = normalize_and_validate_patient_info(result_dict)
-    
-    print("Validated Info:", patient_info)
-    print("Is Complete:", is_patient_info_complete(patient_info))
-    print("Missing info message:", get_missing_info_message(patient_info))
-    print("✅ Test Case 2 Passed")
-
-    # --- Test Case 3: No information ---
-    print("\n--- Test Case 3: No Info ---")
-    messages = [{"role": "user", "content": "Hi there!"}]
-    history = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
-
-    result_dict = greeting_agent.invoke({"conversation_history": history})
-    patient_info = normalize_and_validate_patient_info(result_dict)
-    
-    print("Validated Info:", patient_info)
-    print("Is Complete:", is_patient_info_complete(patient_info))
-    print("Missing info message:", get_missing_info_message(patient_info))
-    print("✅ Test Case 3 Passed")
-
-    print("\n🎉 Greeting Agent tests completed successfully!")
\ No newline at end of file
+    test_cases = [
+        # --- Test Case 1: All information provided ---
+        ("Test Case 1: Full Info", [{"role": "user", "content": "Hi, I'd like to book an appointment. My name is Jane Doe, I was born on March 15, 1985, I'd like to see Dr. Smith at the Downtown Clinic."}]),
+        # --- Test Case 2: Partial information ---
+        ("Test Case 2: Partial Info", [{"role": "user", "content": "Hello, my name is John Smith and I was born on June 10, 1990."}]),
+        # --- Test Case 3: No information ---
+        ("Test Case 3: No Info", [{"role": "user", "content": "Hi there!"}]),
+    ]
+
+    async def main():
+        # The cases are independent, so run them concurrently: total time ≈ the slowest call.
+        histories = [format_history(messages) for _, messages in test_cases]
+        return await asyncio.gather(*[greeting_agent.ainvoke({"conversation_history": h}) for h in histories])
+
+    results = run_async(main())
+
+    for (title, _), result_dict in zip(test_cases, results):
+        print(f"\n--- {title} ---")
+        patient_info = normalize_and_validate_patient_info(result_dict)
+
+        print("Validated Info:", patient_info)
+        print("Is Complete:", is_patient_info_complete(patient_info))
+        if is_patient_info_complete(patient_info):
+            print("Formatted for confirmation:", format_patient_info_for_confirmation(patient_info))
+        else:
+            print("Missing info message:", get_missing_info_message(patient_info))
+        print(f"✅ {title.split(':')[0]} Passed")
+
+    print("\n🎉 Greeting Agent tests completed successfully!")
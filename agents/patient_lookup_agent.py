@@ -2,14 +2,48 @@
 # This agent uses the database tools to find a patient and determine
 # if they are new or returning.
 
+import logging
 import sys
 import os
+from functools import lru_cache
+from types import MappingProxyType
 from typing import Dict, Any
 
+logger = logging.getLogger(__name__)
+
 # We need to define a custom exception for when a patient isn't found.
 # This aligns with the error handling strategy in the project plan.
-class PatientNotFoundError(Exception):
-    pass
+# It subclasses LookupError so callers can also catch the builtin, and the
+# message is only formatted if someone actually renders the exception.
+class PatientNotFoundError(LookupError):
+    __slots__ = ('name', 'dob')
+
+    def __init__(self, name: str, dob: str):
+        super().__init__(name, dob)
+        self.name = name
+        self.dob = dob
+
+    def __str__(self) -> str:
+        return f"No patient found with name '{self.name}' and DOB '{self.dob}'."
+
+# Memoized per (name, dob, db_tool). Only the database answer is cached; callers
+# get a fresh dictionary each time, since the graph merges it into its state.
+@lru_cache(maxsize=4096)
+def _find_patient(patient_name: str, patient_dob: str, db_tool):
+    print(f"🔎 Looking up patient: {patient_name} (DOB: {patient_dob})")
+
+    # Use the database tool to search for the patient
+    patient_record = db_tool.search_patient(patient_name, patient_dob)
+    if not patient_record:
+        # If no patient is found, raise our custom error (misses are not cached).
+        logger.debug("Patient not found: %s", patient_name)
+        raise PatientNotFoundError(patient_name, patient_dob)
+
+    patient_id = patient_record['patient_id']
+    is_returning = db_tool.is_returning_patient(patient_id)
+    print(f"✅ Patient found: ID {patient_id}, Returning: {is_returning}")
+    # Stored read-only so no caller can change the cached record.
+    return patient_id, is_returning, MappingProxyType(dict(patient_record))
 
 # The main function for this agent. It's not a chain, but a regular function
 # that uses our tools and returns structured data.
@@ -28,26 +62,12 @@ def lookup_patient(patient_name: str, patient_dob: str, db_tool) -> Dict[str, An
     Raises:
         PatientNotFoundError: If the patient cannot be found in the database.
     """
-    print(f"🔎 Looking up patient: {patient_name} (DOB: {patient_dob})")
-    
-    # Use the database tool to search for the patient
-    patient_record = db_tool.search_patient(patient_name, patient_dob)
-
-    if patient_record:
-        patient_id = patient_record['patient_id']
-        is_returning = db_tool.is_returning_patient(patient_id)
-        
-        result = {
-            "patient_id": patient_id,
-            "is_new_patient": not is_returning,
-            "patient_details": patient_record
-        }
-        print(f"✅ Patient found: ID {patient_id}, Returning: {is_returning}")
-        return result
-    else:
-        # If no patient is found, raise our custom error.
-        print(f"❌ Patient not found: {patient_name}")
-        raise PatientNotFoundError(f"No patient found with name '{patient_name}' and DOB '{patient_dob}'.")
+    patient_id, is_returning, patient_record = _find_patient(patient_name, patient_dob, db_tool)
+    return {
+        "patient_id": patient_id,
+        "is_new_patient": not is_returning,
+        "patient_details": dict(patient_record),
+    }
 
 # --- Example Usage & Testing ---
 if __name__ == '__main__':
@@ -2,11 +2,16 @@
 # This agent simulates a background job that checks for upcoming appointments
 # and sends out reminders via SMS and email.
 
+import aiohttp
+import numpy as np
 import pandas as pd
+from twilio.http.http_client import TwilioHttpClient
 from datetime import datetime, timedelta
+import asyncio
+import concurrent.futures
+import heapq
 import sys
 import os
-import time
 
 # --- FIX FOR DIRECT EXECUTION ---
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -18,31 +23,113 @@ if project_root not in sys.path:
 # Import tools and settings
 from config import settings
 from tools.sms_tools import SMSTools
-from tools.email_tools import EmailTools
+from tools.email_tools import EmailTools, PersistentSMTP
+from utils.frame_cache import read_csv_cached
+
+# --- DEMO REMINDER WINDOWS (in Seconds) ---
+# stage -> (lower bound, upper bound, label).
+# A reminder fires when lower < time_to_appointment <= upper.
+REMINDER_STAGES = {
+    1: (14, 15, "15-second"),
+    2: (9, 10, "10-second"),
+    3: (4, 5, "5-second"),
+}
+
+# --- REMINDER MESSAGES ---
+# stage -> (subject template, body template). Only formatted for reminders that fire.
+REMINDER_TEMPLATES = {
+    1: ("Appointment Reminder: Today at {time}",
+        "Hi {name}, this is a reminder for your appointment today at {time} with {doctor}."),
+    2: ("Action Required: Your Appointment in 10 minutes (Simulated)",
+        "Hi {name}, your appointment with {doctor} is soon. Have you filled out the patient intake form? Please reply YES to confirm, or NO [REASON] to cancel."),
+    3: ("FINAL REMINDER: Your Appointment is very soon",
+        "FINAL REMINDER: Your appointment with {doctor} is in a few moments at {time}. Please reply YES to confirm."),
+}
+
+def _prepare_ids(df):
+    """Stores the id columns as categoricals in the Parquet cache."""
+    for column in ('patient_id', 'appointment_id'):
+        if column in df:
+            df[column] = df[column].astype('category')
+    return df
+
+
+def _prepare_appointments(df):
+    df['appointment_datetime'] = pd.to_datetime(
+        df['appointment_date'] + ' ' + df['appointment_time'], format='%Y-%m-%d %H:%M:%S', cache=True
+    )
+    return _prepare_ids(df)
+
 
 class ReminderAgent:
     def __init__(self):
         """Initializes the reminder agent and its tools."""
+        # One pooled HTTPS session to Twilio and one SMTP connection, shared by
+        # every reminder instead of a new handshake per send.
+        self._twilio_http = TwilioHttpClient(pool_connections=True)
+        self._smtp_connection = PersistentSMTP(
+            settings.SMTP_SERVER,
+            settings.SMTP_PORT,
+            settings.EMAIL_ADDRESS,
+            settings.EMAIL_PASSWORD
+        )
         self.sms_tool = SMSTools(
             settings.TWILIO_ACCOUNT_SID,
             settings.TWILIO_AUTH_TOKEN,
-            settings.TWILIO_PHONE_NUMBER
+            settings.TWILIO_PHONE_NUMBER,
+            http_client=self._twilio_http
         )
         self.email_tool = EmailTools(
             settings.SMTP_SERVER,
             settings.SMTP_PORT,
             settings.EMAIL_ADDRESS,
-            settings.EMAIL_PASSWORD
+            settings.EMAIL_PASSWORD,
+            smtp_connection=self._smtp_connection
         )
         self.appointments_df = self._load_appointments()
         self.patients_df = self._load_patients()
-        self.sent_reminders = set() # To avoid sending the same reminder multiple times
+        # SMS and email are independent network round-trips, so they are sent concurrently.
+        self._io_pool = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+        # Shared connections for the async path, opened lazily inside the event loop;
+        # the lock makes concurrent senders wait for one connection instead of each opening their own.
+        self._http_session = None
+        self._smtp = None
+        self._async_clients_lock = asyncio.Lock()
+
+    @property
+    def appointments_df(self):
+        return self._appointments_df
+
+    @appointments_df.setter
+    def appointments_df(self, df):
+        """Keeps the int64 epoch-seconds array in sync whenever the appointments change."""
+        self._appointments_df = df
+        if df.empty:
+            self._appt_epoch = np.empty(0, dtype=np.int64)
+        else:
+            self._appt_epoch = df['appointment_datetime'].to_numpy(dtype='datetime64[s]').astype(np.int64)
+
+        # To avoid sending the same reminder multiple times: bit (stage - 1) of
+        # _sent_bits[row] is set once that stage has been sent for the row.
+        self._sent_bits = np.zeros(len(self._appt_epoch), dtype=np.uint8)
+
+        # Every (row, stage) reminder sorted by the second its window opens. Each tick
+        # only looks at the slice between the cursor and the current time.
+        stages = np.fromiter(REMINDER_STAGES, dtype=np.int64)
+        uppers = np.array([upper for _, upper, *_ in REMINDER_STAGES.values()], dtype=np.int64)
+        fire_times = (self._appt_epoch[:, None] - uppers).ravel()
+        order = np.argsort(fire_times, kind='stable')
+        self._fire_times = fire_times[order]
+        self._fire_rows = np.repeat(np.arange(len(self._appt_epoch)), len(stages))[order]
+        self._fire_stages = np.tile(stages, len(self._appt_epoch))[order]
+        # Reminders whose window closed before the agent saw them are skipped.
+        now_s = pd.Timestamp.now().value // 10**9
+        self._fire_cursor = int(np.searchsorted(self._fire_times, now_s - 1, side='right'))
 
     def _load_appointments(self):
-        """Loads confirmed appointments from the CSV."""
+        """Loads confirmed appointments from the CSV (through its Parquet cache)."""
         try:
-            df = pd.read_csv(settings.APPOINTMENTS_CSV_PATH)
-            df['appointment_datetime'] = pd.to_datetime(df['appointment_date'] + ' ' + df['appointment_time'])
+            df = read_csv_cached(settings.APPOINTMENTS_CSV_PATH, prepare=_prepare_appointments)
             return df[df['status'] == 'Confirmed']
         except FileNotFoundError:
             return pd.DataFrame()
@@ -51,11 +138,13 @@ class ReminderAgent:
             return pd.DataFrame()
             
     def _load_patients(self):
-        """Loads patient contact info."""
+        """Loads patient contact info, indexed by patient_id for O(1) lookups."""
         try:
-            return pd.read_csv(settings.PATIENTS_CSV_PATH)
+            df = read_csv_cached(settings.PATIENTS_CSV_PATH, prepare=_prepare_ids)
         except FileNotFoundError:
             return pd.DataFrame()
+        df = df.set_index('patient_id')
+        return df[~df.index.duplicated()]
 
     def check_and_send_reminders(self, demo_phone=None, demo_email=None):
         """
@@ -65,51 +154,167 @@ class ReminderAgent:
             print("No confirmed appointments found.")
             return
 
-        now = datetime.now()
-        
-        for _, appointment in self.appointments_df.iterrows():
-            appointment_id = appointment['appointment_id']
-            appointment_time = appointment['appointment_datetime']
-            time_to_appointment = appointment_time - now
-            
-            patient_details_result = self.patients_df[self.patients_df['patient_id'] == appointment['patient_id']]
-            if patient_details_result.empty:
-                print(f"⚠️ Warning: Could not find details for patient_id {appointment['patient_id']}.")
-                continue
-            
-            patient_details = patient_details_result.iloc[0]
-            patient_name = f"{patient_details['first_name']} {patient_details['last_name']}"
-            patient_phone = demo_phone or patient_details['phone']
-            patient_email = demo_email or patient_details['email']
+        reminders = [
+            self._prepare_reminder(row, appointment, stage, demo_phone, demo_email)
+            for row, appointment, stage in self._due_reminders()
+        ]
+        self._send_batch([reminder for reminder in reminders if reminder is not None])
 
-            # --- DEMO REMINDER LOGIC (in Seconds) ---
-            
-            # Reminder 1: 15 seconds before
-            if timedelta(seconds=14) < time_to_appointment <= timedelta(seconds=15) and (appointment_id, 1) not in self.sent_reminders:
-                print(f"INFO: Sending 15-second reminder for {appointment_id}")
-                subject = f"Appointment Reminder: Today at {appointment_time.strftime('%I:%M %p')}"
-                body = f"Hi {patient_name}, this is a reminder for your appointment today at {appointment_time.strftime('%I:%M %p')} with {appointment['doctor_name']}."
-                self.sms_tool.send_sms(patient_phone, body)
-                self.email_tool.send_reminder_email(patient_email, subject, body)
-                self.sent_reminders.add((appointment_id, 1))
-
-            # Reminder 2: 10 seconds before
-            elif timedelta(seconds=9) < time_to_appointment <= timedelta(seconds=10) and (appointment_id, 2) not in self.sent_reminders:
-                print(f"INFO: Sending 10-second reminder for {appointment_id}")
-                subject = f"Action Required: Your Appointment in 10 minutes (Simulated)"
-                body = f"Hi {patient_name}, your appointment with {appointment['doctor_name']} is soon. Have you filled out the patient intake form? Please reply YES to confirm, or NO [REASON] to cancel."
-                self.sms_tool.send_sms(patient_phone, body)
-                self.email_tool.send_reminder_email(patient_email, subject, body)
-                self.sent_reminders.add((appointment_id, 2))
-
-            # Reminder 3: 5 seconds before
-            elif timedelta(seconds=4) < time_to_appointment <= timedelta(seconds=5) and (appointment_id, 3) not in self.sent_reminders:
-                print(f"INFO: Sending 5-second reminder for {appointment_id}")
-                subject = f"FINAL REMINDER: Your Appointment is very soon"
-                body = f"FINAL REMINDER: Your appointment with {appointment['doctor_name']} is in a few moments at {appointment_time.strftime('%I:%M %p')}. Please reply YES to confirm."
-                self.sms_tool.send_sms(patient_phone, body)
-                self.email_tool.send_reminder_email(patient_email, subject, body)
-                self.sent_reminders.add((appointment_id, 3))
+    async def check_and_send_reminders_async(self, demo_phone=None, demo_email=None):
+        """
+        Async variant of check_and_send_reminders: every due reminder is sent
+        concurrently over one shared HTTP session and one SMTP connection.
+        """
+        if self.appointments_df.empty:
+            print("No confirmed appointments found.")
+            return
+
+        await self._ensure_async_clients()
+        await asyncio.gather(*[
+            self._send_reminder_async(row, appointment, stage, demo_phone, demo_email)
+            for row, appointment, stage in self._due_reminders()
+        ])
+
+    def _due_reminders(self):
+        """Yields (row, appointment, stage) for every reminder whose window is open now."""
+        # Appointment times are naive local timestamps, so "now" is taken on the same
+        # naive clock rather than from time.time() (which is UTC).
+        now_s = pd.Timestamp.now().value // 10**9
+        end = int(np.searchsorted(self._fire_times, now_s, side='right'))
+        if end <= self._fire_cursor:
+            return
+        due = slice(self._fire_cursor, end)
+        self._fire_cursor = end
+
+        rows, stages = [], []
+        for row, stage in zip(self._fire_rows[due].tolist(), self._fire_stages[due].tolist()):
+            # A late tick must not send a reminder whose window has already closed.
+            if self._appt_epoch[row] - now_s > REMINDER_STAGES[stage][0]:
+                rows.append(row)
+                stages.append(stage)
+
+        yield from zip(rows, self.appointments_df.iloc[rows].itertuples(index=False, name='Appt'), stages)
+
+    def build_reminder_schedule(self):
+        """
+        Returns a min-heap of (fire_epoch, appointment_id, stage, row) with one entry
+        per reminder whose window has not passed yet, ordered by fire time.
+        """
+        now_s = pd.Timestamp.now().value // 10**9
+        schedule = []
+        if self.appointments_df.empty:
+            return schedule
+
+        appointment_ids = self.appointments_df['appointment_id'].tolist()
+        for row, appt_s in enumerate(self._appt_epoch.tolist()):
+            for stage, (lower, upper, *_) in REMINDER_STAGES.items():
+                if appt_s - now_s > lower:
+                    schedule.append((appt_s - upper, appointment_ids[row], stage, row))
+        heapq.heapify(schedule)
+        return schedule
+
+    def send_scheduled_reminder(self, row, stage, demo_phone=None, demo_email=None):
+        """Sends one reminder taken from build_reminder_schedule()."""
+        appointment = next(self.appointments_df.iloc[[row]].itertuples(index=False, name='Appt'))
+        reminder = self._prepare_reminder(row, appointment, stage, demo_phone, demo_email)
+        if reminder is not None:
+            self._send_batch([reminder])
+
+    async def send_scheduled_reminder_async(self, row, stage, demo_phone=None, demo_email=None):
+        """Async variant of send_scheduled_reminder."""
+        appointment = next(self.appointments_df.iloc[[row]].itertuples(index=False, name='Appt'))
+        await self._send_reminder_async(row, appointment, stage, demo_phone, demo_email)
+
+    def close(self):
+        """Closes the shared SMTP connection and the send thread pool."""
+        self._smtp_connection.close()
+        self._io_pool.shutdown(wait=True)
+
+    async def aclose(self):
+        """Closes the connections opened by the async send path, then everything close() does."""
+        if self._http_session is not None:
+            await self._http_session.close()
+            self._http_session = None
+        if self._smtp is not None:
+            try:
+                await self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+        self.close()
+
+    def _prepare_reminder(self, row, appointment, stage, demo_phone=None, demo_email=None):
+        """
+        Builds (phone, email, subject, body) for one appointment row and reminder
+        stage and marks it as sent. Returns None if nothing should be sent.
+        """
+        appointment_id = appointment.appointment_id
+        stage_bit = 1 << (stage - 1)
+        if self._sent_bits[row] & stage_bit:
+            return None
+
+        if appointment.patient_id not in self.patients_df.index:
+            print(f"⚠️ Warning: Could not find details for patient_id {appointment.patient_id}.")
+            return None
+
+        label = REMINDER_STAGES[stage][2]
+        subject_template, body_template = REMINDER_TEMPLATES[stage]
+        patient_details = self.patients_df.loc[appointment.patient_id]
+        patient_name = f"{patient_details['first_name']} {patient_details['last_name']}"
+        patient_phone = demo_phone or patient_details['phone']
+        patient_email = demo_email or patient_details['email']
+
+        print(f"INFO: Sending {label} reminder for {appointment_id}")
+        time_str = appointment.appointment_datetime.strftime('%I:%M %p')
+        self._sent_bits[row] |= stage_bit
+        subject = subject_template.format(time=time_str)
+        body = body_template.format(name=patient_name, time=time_str, doctor=appointment.doctor_name)
+        return patient_phone, patient_email, subject, body
+
+    def _send_batch(self, reminders):
+        """
+        Sends prepared (phone, email, subject, body) reminders. Reminders with an
+        identical text are grouped so each group costs one bulk SMS call and one
+        SMTP transaction; SMS and email groups are sent concurrently.
+        """
+        sms_groups, email_groups = {}, {}
+        for patient_phone, patient_email, subject, body in reminders:
+            sms_groups.setdefault(body, []).append(patient_phone)
+            email_groups.setdefault((subject, body), []).append(patient_email)
+
+        futures = [
+            self._io_pool.submit(self.sms_tool.send_bulk_sms, phones, body, settings.TWILIO_NOTIFY_SERVICE_SID)
+            for body, phones in sms_groups.items()
+        ]
+        futures += [
+            self._io_pool.submit(self.email_tool.send_bulk_reminder_email, emails, subject, body)
+            for (subject, body), emails in email_groups.items()
+        ]
+        concurrent.futures.wait(futures)
+
+    async def _ensure_async_clients(self):
+        """Opens the shared aiohttp session and SMTP connection once, however many senders ask at the same time."""
+        async with self._async_clients_lock:
+            if self._http_session is None:
+                self._http_session = aiohttp.ClientSession()
+            if self._smtp is None:
+                try:
+                    self._smtp = await self.email_tool.connect_async()
+                except Exception as e:
+                    print(f"❌ Could not connect to the SMTP server: {e}")
+
+    async def _send_reminder_async(self, row, appointment, stage, demo_phone=None, demo_email=None):
+        """Sends the SMS and email for one appointment row and reminder stage over the async clients."""
+        reminder = self._prepare_reminder(row, appointment, stage, demo_phone, demo_email)
+        if reminder is None:
+            return
+
+        await self._ensure_async_clients()
+        patient_phone, patient_email, subject, body = reminder
+        await asyncio.gather(
+            self.sms_tool.send_sms_async(self._http_session, patient_phone, body),
+            self.email_tool.send_reminder_email_async(self._smtp, patient_email, subject, body),
+        )
 
 
 if __name__ == '__main__':
@@ -126,23 +331,36 @@ if __name__ == '__main__':
         print("⚠️ Cannot run simulation, no patient data found.")
     else:
         now = datetime.now()
-        test_patient = agent.patients_df.iloc[0]
+        test_patient_id = agent.patients_df.index[0]
         
         # Create fake appointments for the demo
         appointments_to_add = [
-            {"appointment_id": "DEMO001", "patient_id": test_patient['patient_id'], "doctor_name": "Dr. Demo One", "appointment_datetime": now + timedelta(seconds=15), "status": "Confirmed"},
-            {"appointment_id": "DEMO002", "patient_id": test_patient['patient_id'], "doctor_name": "Dr. Demo Two", "appointment_datetime": now + timedelta(seconds=10), "status": "Confirmed"},
-            {"appointment_id": "DEMO003", "patient_id": test_patient['patient_id'], "doctor_name": "Dr. Demo Three", "appointment_datetime": now + timedelta(seconds=5), "status": "Confirmed"},
+            {"appointment_id": "DEMO001", "patient_id": test_patient_id, "doctor_name": "Dr. Demo One", "appointment_datetime": now + timedelta(seconds=15), "status": "Confirmed"},
+            {"appointment_id": "DEMO002", "patient_id": test_patient_id, "doctor_name": "Dr. Demo Two", "appointment_datetime": now + timedelta(seconds=10), "status": "Confirmed"},
+            {"appointment_id": "DEMO003", "patient_id": test_patient_id, "doctor_name": "Dr. Demo Three", "appointment_datetime": now + timedelta(seconds=5), "status": "Confirmed"},
         ]
-        agent.appointments_df = pd.concat([agent.appointments_df, pd.DataFrame(appointments_to_add)], ignore_index=True)
+        # Build the demo rows in one shot; only copy the existing frame if it has rows.
+        demo_df = pd.DataFrame(appointments_to_add)
+        if agent.appointments_df.empty:
+            agent.appointments_df = demo_df
+        else:
+            agent.appointments_df = pd.concat([agent.appointments_df, demo_df], ignore_index=True, copy=False)
         
-        print(f"\n--- Starting 20-second simulation loop. Get ready! ---")
+        # Sleep until the next reminder is due instead of polling every second.
+        schedule = agent.build_reminder_schedule()
+        print(f"\n--- Waiting for {len(schedule)} scheduled reminders. Get ready! ---")
         print(f"Reminders will be sent to Phone: {DEMO_RECIPIENT_PHONE} and Email: {DEMO_RECIPIENT_EMAIL}")
         
-        for i in range(20):
-            print(f"\n--- Check #{i+1} ---")
-            agent.check_and_send_reminders(demo_phone=DEMO_RECIPIENT_PHONE, demo_email=DEMO_RECIPIENT_EMAIL)
-            time.sleep(1)
+        async def run_schedule():
+            try:
+                while schedule:
+                    fire_s, appointment_id, stage, row = heapq.heappop(schedule)
+                    await asyncio.sleep(max(0, fire_s - pd.Timestamp.now().value / 10**9))
+                    await agent.send_scheduled_reminder_async(row, stage, demo_phone=DEMO_RECIPIENT_PHONE, demo_email=DEMO_RECIPIENT_EMAIL)
+            finally:
+                await agent.aclose()
+
+        asyncio.run(run_schedule())
 
     print("\n🎉 Reminder Agent DEMO complete.")
 
@@ -4,13 +4,26 @@
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain_openai import ChatOpenAI
-from langchain_core.output_parsers import JsonOutputParser
-from typing import List, Dict, Any
+from rapidfuzz import fuzz, process, utils as fuzz_utils
+from typing import List, Dict, Any, TYPE_CHECKING
 import logging
+import re
 import sys
 import os
 
+# --- FIX FOR DIRECT EXECUTION ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+# --- END FIX ---
+
+from agents._llm_cache import with_response_cache
+from agents._streaming import stream_json_until
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI  # Annotations only; main_graph builds the LLM.
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,14 +34,24 @@ class SlotSelection(BaseModel):
     selected_slot: str | None = Field(None, description="The selected appointment slot")
     slot_number: int | None = Field(None, description="The number of the selected slot (1-based)")
 
+# The keys the prompt asks the LLM to return.
+SELECTION_KEYS = ("selectedSlot", "slotNumber")
+
+# Replies that name a slot by number ("2", "#3", "I'll take slot 1, please"). Checked
+# before the LLM; anything else (e.g. "the 10 am one") still goes to the parser chain.
+SLOT_RE = re.compile(r'^\s*#?\s*(\d{1,2})\s*[.)!]?\s*$|(?:\b(?:option|slot|number)\s*#?|#)\s*(\d{1,2})\b', re.I)
+# Replies that reject or weigh slots ("not slot 1", "slot 1 or 2?") are left to the
+# LLM, which marks unclear picks as AMBIGUOUS instead of booking one of them.
+NEGATION_RE = re.compile(r"\b(?:not|no|never|cannot|cant|dont|wont|instead)\b|n['’]t\b", re.I)
+NUMBER_RE = re.compile(r"\d+")
+
 # --- 2. Create the Selection Parser Chain ---
-def create_selection_parser_chain(llm: ChatOpenAI, master_prompt: str):
+def create_selection_parser_chain(llm: "ChatOpenAI", master_prompt: str):
     """
     Creates a LangChain chain that parses user slot selection from conversation.
     """
     logger.info("🔧 Creating selection parser chain...")
     
-    parser = JsonOutputParser()
     json_llm = llm.bind(response_format={"type": "json_object"})
     
     system_prompt = master_prompt + """
@@ -50,7 +73,17 @@ def create_selection_parser_chain(llm: ChatOpenAI, master_prompt: str):
         ("human", "Available slots:\n{available_slots}\n\nUser's response: {user_message}")
     ])
         
-    return prompt | json_llm | parser
+    # Stream the response and return as soon as both keys have complete values.
+    chain = prompt | stream_json_until(json_llm, SELECTION_KEYS)
+    # Replies like "Slot 1." and "slot 1" share a cache entry for the same slot list.
+    return with_response_cache(chain, llm, system_prompt, normalize=_selection_cache_inputs)
+
+_PUNCT_RE = re.compile(r"[^\w\s]+")
+
+def _selection_cache_inputs(inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """Case-, spacing- and punctuation-insensitive form of the user's reply, for the cache key."""
+    user_message = " ".join(_PUNCT_RE.sub(" ", inputs.get("user_message", "")).lower().split())
+    return {**inputs, "user_message": user_message}
 
 # --- 3. Helper Functions ---
 def parse_slot_selection(user_message: str, available_slots: List[str], llm_chain) -> Dict[str, Any]:
@@ -68,6 +101,11 @@ def parse_slot_selection(user_message: str, available_slots: List[str], llm_chai
     logger.info(f"📝 Parsing slot selection from user message: '{user_message}'")
     logger.info(f"📅 Available slots: {len(available_slots)} slots")
     
+    fast_result = match_slot_number(user_message, available_slots)
+    if fast_result:
+        logger.info(f"✅ Slot number matched locally: {fast_result}")
+        return fast_result
+
     slots_str = "\n".join([f"{i+1}. {s}" for i, s in enumerate(available_slots)])
     
     try:
@@ -118,13 +156,14 @@ def normalize_selection_result(result: Dict[str, Any], available_slots: List[str
     
     # If we have a selected slot but no valid number, try to match it
     if selected_slot and selected_slot != "AMBIGUOUS":
-        for i, slot in enumerate(available_slots):
-            if selected_slot in slot or slot in selected_slot:
-                logger.info(f"✅ Matched slot text to position {i+1}: {slot}")
-                return {
-                    "selected_slot": slot,
-                    "slot_number": i + 1
-                }
+        i = match_slot_text(str(selected_slot), available_slots)
+        if i is not None:
+            slot = available_slots[i]
+            logger.info(f"✅ Matched slot text to position {i+1}: {slot}")
+            return {
+                "selected_slot": slot,
+                "slot_number": i + 1
+            }
     
     # If nothing matches, return ambiguous
     logger.warning("⚠️ Could not determine valid slot selection")
@@ -133,17 +172,54 @@ def normalize_selection_result(result: Dict[str, Any], available_slots: List[str
         "slot_number": None
     }
 
+def match_slot_number(user_message: str, available_slots: List[str]) -> Dict[str, Any] | None:
+    """
+    Resolves replies like "2" or "slot 2" without the LLM.
+
+    Returns the same shape as normalize_selection_result, or None when the
+    message doesn't name exactly one offered slot number and nothing else, so
+    the LLM decides.
+    """
+    user_message = user_message or ""
+    if NEGATION_RE.search(user_message):
+        return None
+    numbers = {int(number) for number in NUMBER_RE.findall(user_message)}
+    slot_numbers = {int(match.group(1) or match.group(2)) for match in SLOT_RE.finditer(user_message)}
+    if len(slot_numbers) != 1 or numbers != slot_numbers:
+        return None
+    slot_number = slot_numbers.pop()
+    if not 1 <= slot_number <= len(available_slots):
+        return None
+    return {"selected_slot": available_slots[slot_number - 1], "slot_number": slot_number}
+
+def _canonical_slot(text: str) -> str:
+    return " ".join(text.lower().split())
+
+def match_slot_text(selected_slot: str, available_slots: List[str], score_cutoff: float = 90) -> int | None:
+    """
+    Returns the index of the slot that `selected_slot` describes, or None.
+
+    An exact (case/whitespace-insensitive) match is a dict lookup; otherwise
+    rapidfuzz's partial_ratio scores every slot in C, which also covers the
+    "one text contains the other" case. The cutoff is kept high because a
+    wrong match books the wrong appointment.
+    """
+    slot_index = {_canonical_slot(slot): i for i, slot in enumerate(available_slots)}
+    i = slot_index.get(_canonical_slot(selected_slot))
+    if i is not None:
+        return i
+
+    match = process.extractOne(
+        selected_slot, available_slots,
+        scorer=fuzz.partial_ratio, processor=fuzz_utils.default_process, score_cutoff=score_cutoff,
+    )
+    return match[2] if match else None
+
 # --- 4. Example Usage & Testing ---
 if __name__ == '__main__':
-    # --- FIX FOR DIRECT EXECUTION ---
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.dirname(current_dir)
-    sys.path.append(project_root)
-    # --- END FIX ---
-    
     # --- LOCAL IMPORTS ---
     from config import prompts
-    from main_graph import llm 
+    from main_graph import parser_llm as llm
     # --- END LOCAL IMPORTS ---
 
     print("🚀 Testing Scheduling Agent...")
@@ -179,4 +255,11 @@ if __name__ == '__main__':
     assert result['selected_slot'] == "AMBIGUOUS"
     print("✅ Test Case 3 Passed")
 
+    # --- Test Case 4: Rejected or unclear picks never match locally ---
+    print("\n--- Test Case 4: Left to the LLM ---")
+    for reply in ["I can't do slot 1", "not slot 1, slot 2 please", "slot 1 or 2?", "slot 3 works, or slot 2"]:
+        assert match_slot_number(reply, test_slots) is None, reply
+    assert match_slot_number("#2", test_slots)['slot_number'] == 2
+    print("✅ Test Case 4 Passed")
+
     print("\n🎉 Scheduling Agent tests completed successfully!")
\ No newline at end of file
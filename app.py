@@ -4,7 +4,6 @@
 import streamlit as st
 import sys
 import os
-import uuid
 
 # --- FIX FOR STREAMLIT RUN ---
 # Add the project root to the Python path to allow imports from other folders.
@@ -13,8 +12,13 @@ if current_dir not in sys.path:
     sys.path.append(current_dir)
 # --- END FIX ---
 
-# --- Import the LangGraph Application ---
-from main_graph import app as medical_agent_app
+# --- Load the LangGraph Application Lazily ---
+# Importing main_graph pulls in the whole LangChain stack, so it is deferred until
+# the first message and shared across sessions; the page itself renders instantly.
+@st.cache_resource
+def _get_app():
+    from main_graph import invoke_app
+    return invoke_app
 
 # --- 1. Page Configuration ---
 st.set_page_config(
@@ -33,6 +37,7 @@ To get started, please tell me your **full name** and **date of birth**.
 if 'messages' not in st.session_state:
     st.session_state['messages'] = []
 if 'thread_id' not in st.session_state:
+    import uuid
     st.session_state['thread_id'] = str(uuid.uuid4())
 if 'agent_state' not in st.session_state:
     st.session_state.agent_state = {}
@@ -41,10 +46,18 @@ if 'processing' not in st.session_state:
 
 # --- 3. Chat Interface Logic ---
 
-# Display all existing messages (single source of truth)
+# Display all existing messages (single source of truth). Streamlit rebuilds the
+# page on every run, so this is the only full pass; replies are appended to the
+# same container as they arrive instead of replaying everything via st.rerun().
+chat_log = st.container()
+
+def render_message(msg):
+    with chat_log:
+        with st.chat_message(msg["role"]):
+            st.write(msg["content"])
+
 for msg in st.session_state.messages:
-    with st.chat_message(msg["role"]):
-        st.write(msg["content"])
+    render_message(msg)
 
 # Get user input
 prompt = st.chat_input("Your response here...")
@@ -56,8 +69,8 @@ if prompt and not st.session_state.processing:
     st.session_state.messages.append({"role": "user", "content": prompt})
     
     # Display the user message
-    with st.chat_message("user"):
-        st.write(prompt)
+    render_message(st.session_state.messages[-1])
+    first_new_index = len(st.session_state.messages)
     
     # Process with agent
     with st.spinner("Thinking..."):
@@ -69,7 +82,8 @@ if prompt and not st.session_state.processing:
             current_state['messages'] = st.session_state.messages.copy()
             
             # Invoke the agent
-            result = medical_agent_app.invoke(current_state, config=config)
+            invoke_agent = _get_app()
+            result = invoke_agent(current_state, config=config)
             
             # Update agent state
             st.session_state.agent_state = result
@@ -80,9 +94,10 @@ if prompt and not st.session_state.processing:
                 agent_messages = result['messages']
                 
                 # Add only new messages that aren't already in our state
-                for i in range(current_msg_count, len(agent_messages)):
-                    new_msg = agent_messages[i]
-                    if new_msg not in st.session_state.messages:
+                seen_ids = {id(msg) for msg in st.session_state.messages}
+                for new_msg in agent_messages[current_msg_count:]:
+                    if id(new_msg) not in seen_ids:
+                        seen_ids.add(id(new_msg))
                         st.session_state.messages.append(new_msg)
         
         except Exception as e:
@@ -92,6 +107,7 @@ if prompt and not st.session_state.processing:
                  "content": f"Sorry, I encountered an error: {str(e)}"
             })
     
-    # Reset processing flag and rerun to show all messages
+    # Show only the replies added in this run and reset the processing flag
+    for msg in st.session_state.messages[first_new_index:]:
+        render_message(msg)
     st.session_state.processing = False
-    st.rerun()
\ No newline at end of file
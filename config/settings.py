@@ -2,6 +2,7 @@
 # This file loads environment variables and sets up application-wide configurations.
 
 import os
+from pathlib import Path
 from dotenv import load_dotenv
 
 # Load environment variables from the .env file in the project root
@@ -14,12 +15,25 @@ OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 # Recommended model: 'meta-llama/llama-3-8b-instruct'
 # Other good options: 'mistralai/mistral-7b-instruct-v0.2', 'google/gemma-7b-it'
 OPENROUTER_MODEL_NAME = "qwen/qwen3-8b:free"
+# The parser chains only extract a few JSON fields, so they run on a smaller,
+# faster model. Override with any OpenRouter model that supports JSON output.
+OPENROUTER_PARSER_MODEL_NAME = os.getenv("OPENROUTER_PARSER_MODEL_NAME", "meta-llama/llama-3.2-3b-instruct:free")
 OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
 
+# --- LLM Response Cache ---
+# Deterministic parser chains cache their responses in a local SQLite file, so
+# repeated prompts are answered without a network call even across restarts.
+# Set a Redis URL to share the cache between processes (requires `redis`), or set
+# LLM_CACHE_SQLITE_PATH to an empty value to keep the cache in memory only.
+LLM_CACHE_REDIS_URL = os.getenv("LLM_CACHE_REDIS_URL")
+LLM_CACHE_SQLITE_PATH = os.getenv("LLM_CACHE_SQLITE_PATH", ".llm_cache.db")
+
 # --- Twilio Configuration (for SMS) ---
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
+# Optional: a Twilio Notify service lets one API call fan a message out to many numbers.
+TWILIO_NOTIFY_SERVICE_SID = os.getenv("TWILIO_NOTIFY_SERVICE_SID")
 
 # --- Email Configuration (for SMTP) ---
 # Note: You will need to configure these in your .env file for email to work.
@@ -30,11 +44,11 @@ EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD") # For Gmail, this should be an "App
 
 # --- Data File Paths ---
 # Centralizing file paths makes them easier to manage.
-DATA_DIR = "data"
-PATIENTS_CSV_PATH = os.path.join(DATA_DIR, "patients.csv")
-DOCTOR_SCHEDULES_PATH = os.path.join(DATA_DIR, "doctor_schedules.xlsx")
-APPOINTMENTS_CSV_PATH = os.path.join(DATA_DIR, "appointments.csv")
-INTAKE_FORM_PATH = os.path.join(DATA_DIR, "forms", "New Patient Intake Form.pdf")
+DATA_DIR = Path("data")
+PATIENTS_CSV_PATH = DATA_DIR / "patients.csv"
+DOCTOR_SCHEDULES_PATH = DATA_DIR / "doctor_schedules.xlsx"
+APPOINTMENTS_CSV_PATH = DATA_DIR / "appointments.csv"
+INTAKE_FORM_PATH = DATA_DIR / "forms" / "New Patient Intake Form.pdf"
 
 # --- Application Settings ---
 APPOINTMENT_DURATIONS = {
@@ -43,5 +57,4 @@ APPOINTMENT_DURATIONS = {
 }
 
 # --- Exports Directory ---
-EXPORTS_DIR = "exports"
-os.makedirs(EXPORTS_DIR, exist_ok=True) # Ensure the directory exists
+EXPORTS_DIR = Path("exports") # ExportTools creates it when it writes the first report
@@ -2,10 +2,10 @@
 # This script creates synthetic data for patients and doctor schedules
 # based on the project plan.
 
+import numpy as np
 import pandas as pd
 from faker import Faker
-import random
-from datetime import date, timedelta, time
+from datetime import date
 import os
 
 # --- Configuration ---
@@ -21,27 +21,28 @@ def generate_patients(n=50):
     Generates a DataFrame with n synthetic patients, including insurance
     and visit history, as specified in the project plan.
     """
-    patients = []
     insurance_carriers = ["Blue Cross", "Aetna", "Cigna", "UnitedHealth", "Medicare"]
     
-    for i in range(n):
-        # Determine if the patient has a visit history to classify them as new or returning
-        has_history = random.choice([True, False])
-        
-        patient = {
-            "patient_id": f"P{i+1:03d}",
-            "first_name": fake.first_name(),
-            "last_name": fake.last_name(),
-            "date_of_birth": fake.date_of_birth(minimum_age=18, maximum_age=90).strftime('%Y-%m-%d'),
-            "phone": fake.phone_number(),
-            "email": fake.email(),
-            "address": fake.address().replace('\n', ', '),
-            "insurance_carrier": random.choice(insurance_carriers),
-            "member_id": fake.bothify(text='???#########', letters='ABCDEFGHIJKLMNOPQRSTUVWXYZ'),
-            "visit_history": random.randint(1, 15) if has_history else 0,
-            "last_visit": fake.date_between(start_date='-2y', end_date='-1w').strftime('%Y-%m-%d') if has_history else None
-        }
-        patients.append(patient)
+    # Determine if each patient has a visit history to classify them as new or returning
+    has_history = np.random.random(n) < 0.5
+    
+    # Build column-wise (one list/array per field) and construct the DataFrame once.
+    patients = {
+        "patient_id": [f"P{i+1:03d}" for i in range(n)],
+        "first_name": [fake.first_name() for _ in range(n)],
+        "last_name": [fake.last_name() for _ in range(n)],
+        "date_of_birth": [fake.date_of_birth(minimum_age=18, maximum_age=90).strftime('%Y-%m-%d') for _ in range(n)],
+        "phone": [fake.phone_number() for _ in range(n)],
+        "email": [fake.email() for _ in range(n)],
+        "address": [fake.address().replace('\n', ', ') for _ in range(n)],
+        "insurance_carrier": np.random.choice(insurance_carriers, size=n),
+        "member_id": [fake.bothify(text='???#########', letters='ABCDEFGHIJKLMNOPQRSTUVWXYZ') for _ in range(n)],
+        "visit_history": np.where(has_history, np.random.randint(1, 16, size=n), 0),
+        "last_visit": [
+            fake.date_between(start_date='-2y', end_date='-1w').strftime('%Y-%m-%d') if returning else None
+            for returning in has_history
+        ],
+    }
     
     df = pd.DataFrame(patients)
     print(f"✅ Generated {len(df)} patient records with detailed information.")
@@ -58,35 +59,36 @@ def generate_doctor_schedules():
         {"doctor_id": "D003", "name": "Dr. Williams", "specialty": "Dermatology"}
     ]
     
-    schedules = []
-    start_date = date.today()
+    # Define working sessions: 9 AM - 12 PM and 1 PM - 5 PM
+    sessions = [("09:00:00", "12:00:00"), ("13:00:00", "17:00:00")]
+
+    # Doctors work Monday to Friday (weekday() < 5)
+    dates = pd.date_range(date.today(), periods=SCHEDULE_DAYS)
+    workdays = dates[dates.weekday < 5]
+
+    # Every (doctor, workday, session) combination, in doctor -> day -> session order.
+    doctor_idx, day_idx, session_idx = np.indices((len(doctors), len(workdays), len(sessions))).reshape(3, -1)
+
+    # Randomly introduce a day off or half-day, drawn once per (doctor, workday)
+    n_doctor_days = len(doctors) * len(workdays)
+    day_off = np.random.random(n_doctor_days) < 0.05 # 5% chance of a full day off
+    half_day = np.random.random(n_doctor_days) < 0.1 # 10% chance of a half-day off
+    dropped_session = np.random.randint(len(sessions), size=n_doctor_days)
 
-    for doctor in doctors:
-        for i in range(SCHEDULE_DAYS):
-            current_date = start_date + timedelta(days=i)
-            # Doctors work Monday to Friday (weekday() < 5)
-            if current_date.weekday() < 5:
-                # Define working sessions: 9 AM - 12 PM and 1 PM - 5 PM
-                working_hours = [
-                    {"start": time(9, 0), "end": time(12, 0)},
-                    {"start": time(13, 0), "end": time(17, 0)}
-                ]
-                
-                # Randomly introduce a day off or half-day
-                if random.random() < 0.05: # 5% chance of a full day off
-                    continue
-                if random.random() < 0.1: # 10% chance of a half-day off
-                    working_hours.pop(random.randrange(len(working_hours)))
+    doctor_day = doctor_idx * len(workdays) + day_idx
+    keep = ~day_off[doctor_day] & ~(half_day[doctor_day] & (session_idx == dropped_session[doctor_day]))
+    doctor_idx, day_idx, session_idx = doctor_idx[keep], day_idx[keep], session_idx[keep]
 
-                for session in working_hours:
-                    schedules.append({
-                        "doctor_id": doctor["doctor_id"],
-                        "doctor_name": doctor["name"],
-                        "date": current_date.strftime('%Y-%m-%d'),
-                        "start_time": session["start"].strftime('%H:%M:%S'),
-                        "end_time": session["end"].strftime('%H:%M:%S'),
-                        "is_available": True
-                    })
+    doctors_df = pd.DataFrame(doctors)
+    session_starts, session_ends = (np.array(column) for column in zip(*sessions))
+    schedules = {
+        "doctor_id": doctors_df["doctor_id"].to_numpy()[doctor_idx],
+        "doctor_name": doctors_df["name"].to_numpy()[doctor_idx],
+        "date": workdays.strftime('%Y-%m-%d').to_numpy()[day_idx],
+        "start_time": session_starts[session_idx],
+        "end_time": session_ends[session_idx],
+        "is_available": True,
+    }
     
     df = pd.DataFrame(schedules)
     print(f"✅ Generated {len(df)} schedule slots for {len(doctors)} doctors.")
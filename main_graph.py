@@ -2,11 +2,15 @@
 # This file defines the core state machine and workflow, now with extended information collection and confirmation.
 
 from typing import TypedDict, List, Annotated, Literal
-import operator
+import asyncio
+import re
 import sys
 import os
+import threading
 from datetime import datetime, timedelta
+from types import MappingProxyType
 
+import httpx
 from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, END
 
@@ -32,16 +36,32 @@ from agents.greeting_agent import (
     is_patient_info_complete
 )
 from agents.patient_lookup_agent import lookup_patient, PatientNotFoundError
-from agents.scheduling_agent import create_selection_parser_chain
-from agents.insurance_agent import create_insurance_parser_chain, normalize_and_validate_insurance_info
+from agents.scheduling_agent import create_selection_parser_chain, match_slot_number, normalize_selection_result
+from agents.insurance_agent import create_insurance_parser_chain, aparse_insurance
 
 # --- 1. Define the State for the Graph ---
+def merge_messages(existing: List[dict], new: List[dict]) -> List[dict]:
+    """
+    Reducer for `messages`. Nodes append to state['messages'] and return the
+    whole list, so only the tail past `existing` is new; it is appended in place
+    rather than concatenating (and duplicating) the full history on every node.
+    """
+    if not existing:
+        return list(new)
+    if new is existing:
+        return existing
+    if len(new) >= len(existing) and new[len(existing) - 1] is existing[-1]:
+        existing.extend(new[len(existing):])
+    else:
+        existing.extend(new)
+    return existing
+
 class AgentState(TypedDict, total=False):
     """
     Represents the state of our conversation.
     `total=False` means keys are optional.
     """
-    messages: Annotated[List[dict], operator.add]
+    messages: Annotated[List[dict], merge_messages]
     patient_info: PatientInfo | None 
     patient_id: str | None
     is_new_patient: bool | None
@@ -49,16 +69,33 @@ class AgentState(TypedDict, total=False):
     chosen_slot: str | None
     appointment_id: str | None # To store the final ID
     patient_email: str | None # To store patient's email
+    last_user_message: str | None # Set once per turn by ingest_node
     conversation_stage: str
 
 # --- 2. Initialize Models and Tools ---
-llm = ChatOpenAI(
-    model=settings.OPENROUTER_MODEL_NAME,
-    api_key=settings.OPENROUTER_API_KEY,
-    base_url=settings.OPENROUTER_BASE_URL,
-    temperature=0,
-    streaming=True,
-)
+# Shared, pooled HTTP clients so every LLM call reuses warm TCP/TLS connections;
+# HTTP/2 multiplexes concurrent requests over a single connection.
+_http_limits = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+_http_client = httpx.Client(http2=True, limits=_http_limits, timeout=30)
+_http_async_client = httpx.AsyncClient(http2=True, limits=_http_limits, timeout=30)
+
+def _create_llm(model_name: str) -> ChatOpenAI:
+    return ChatOpenAI(
+        model=model_name,
+        api_key=settings.OPENROUTER_API_KEY,
+        base_url=settings.OPENROUTER_BASE_URL,
+        temperature=0,
+        streaming=True,
+        timeout=30,
+        http_client=_http_client,
+        http_async_client=_http_async_client,
+    )
+
+# The general model is kept for free-form replies; every chain in the graph today
+# is a JSON extractor, and those run on the small parser model (each chain binds
+# its own JSON response format).
+llm = _create_llm(settings.OPENROUTER_MODEL_NAME)
+parser_llm = _create_llm(settings.OPENROUTER_PARSER_MODEL_NAME)
 
 patient_db = PatientDB(filepath=settings.PATIENTS_CSV_PATH)
 calendar_tool = CalendarTools(
@@ -66,22 +103,47 @@ calendar_tool = CalendarTools(
     appointments_filepath=settings.APPOINTMENTS_CSV_PATH,
     appointment_durations=settings.APPOINTMENT_DURATIONS
 )
+email_tool = EmailTools(settings.SMTP_SERVER, settings.SMTP_PORT, settings.EMAIL_ADDRESS, settings.EMAIL_PASSWORD)
 export_tool = ExportTools(
     appointments_filepath=settings.APPOINTMENTS_CSV_PATH,
     patients_filepath=settings.PATIENTS_CSV_PATH,
     exports_dir=settings.EXPORTS_DIR
 )
-greeting_agent_chain = create_greeting_chain(llm, prompts.MASTER_PROMPT)
-selection_parser_chain = create_selection_parser_chain(llm, prompts.MASTER_PROMPT)
-insurance_parser_chain = create_insurance_parser_chain(llm, prompts.MASTER_PROMPT)
+greeting_agent_chain = create_greeting_chain(parser_llm, prompts.MASTER_PROMPT)
+selection_parser_chain = create_selection_parser_chain(parser_llm, prompts.MASTER_PROMPT)
+insurance_parser_chain = create_insurance_parser_chain(parser_llm, prompts.MASTER_PROMPT)
 
 # --- 3. Define the Nodes with Extended Information Collection ---
 
+# The parser chains only need the last few turns (patient info is merged across
+# turns in the state), so prompts stay small however long the conversation gets.
+HISTORY_WINDOW = 6
+
+# Fire-and-forget tasks; holding a reference keeps them from being garbage-collected mid-flight.
+_background_tasks = set()
+
+def run_in_background(coro) -> asyncio.Task:
+    """Starts `coro` on the running loop without waiting for it."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
 def format_history(messages: List[dict]) -> str:
-    """Helper function to format message history for prompts."""
-    return "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
+    """Helper function to format the recent message history for prompts."""
+    return "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages[-HISTORY_WINDOW:])
+
+def ingest_node(state: AgentState):
+    """
+    Runs first on every turn: records the newest user message so the other nodes
+    read it directly instead of scanning the history.
+    """
+    messages = state.get('messages')
+    if messages and messages[-1]['role'] == 'user':
+        return {'last_user_message': messages[-1]['content']}
+    return {}
 
-def greeting_node(state: AgentState):
+async def greeting_node(state: AgentState):
     """
     Initial greeting node that collects patient information and asks for missing details.
     """
@@ -98,7 +160,7 @@ def greeting_node(state: AgentState):
     
     # Parse the conversation to extract patient information
     history = format_history(state['messages'])
-    raw_info = greeting_agent_chain.invoke({"conversation_history": history})
+    raw_info = await greeting_agent_chain.ainvoke({"conversation_history": history})
     patient_info = normalize_and_validate_patient_info(raw_info)
     
     # Update the state with the current patient info
@@ -125,6 +187,16 @@ def greeting_node(state: AgentState):
     
     return state
 
+# Whole-word matches, so "incorrect" isn't read as "correct" and "know" isn't "no".
+YES_RE = re.compile(r"\b(?:yes|correct|right|confirm\w*|looks good)\b", re.I)
+# Corrections only: a leading "no", an explicit "wrong", or asking to change something.
+# "Yes, no changes needed" must not count, so a bare "no"/"change" mid-sentence doesn't.
+NO_RE = re.compile(
+    r"^\W*(?:no|nope|nah)\b|\b(?:wrong|incorrect|not (?:right|correct))\b"
+    r"|\b(?:change|update|fix)\w*\s+(?:it|that|this|the|my)\b",
+    re.I,
+)
+
 def information_confirmation_node(state: AgentState):
     """
     Node that displays collected information and asks for user confirmation.
@@ -132,18 +204,14 @@ def information_confirmation_node(state: AgentState):
     print("---NODE: INFORMATION CONFIRMATION---")
     
     # Check if this is a confirmation response
-    last_user_message = None
-    for msg in reversed(state['messages']):
-        if msg['role'] == 'user':
-            last_user_message = msg['content'].lower().strip()
-            break
+    last_user_message = state.get('last_user_message')
     
     # If user is confirming or correcting
-    if last_user_message and any(word in last_user_message for word in ['yes', 'correct', 'right', 'confirm', 'looks good']):
+    if last_user_message and YES_RE.search(last_user_message) and not NO_RE.search(last_user_message):
         # User confirmed, move to patient lookup
         state['conversation_stage'] = 'patient_lookup'
         return state
-    elif last_user_message and any(word in last_user_message for word in ['no', 'wrong', 'incorrect', 'change', 'update']):
+    elif last_user_message and NO_RE.search(last_user_message):
         # User wants to make changes, go back to greeting
         state['messages'].append({
             "role": "assistant",
@@ -162,11 +230,15 @@ def information_confirmation_node(state: AgentState):
     
     return state
 
-def patient_lookup_node(state: AgentState):
+async def patient_lookup_node(state: AgentState):
     print("---NODE: PATIENT LOOKUP---")
     patient_info = state['patient_info']
+    # Refresh the booked slots for find_slots while the patient is looked up; neither
+    # depends on the other, and find_slots then only has to confirm the file is unchanged.
+    refresh = asyncio.create_task(asyncio.to_thread(calendar_tool._load_booked_slots))
     try:
-        lookup_result = lookup_patient(
+        lookup_result = await asyncio.to_thread(
+            lookup_patient,
             patient_name=patient_info.full_name,
             patient_dob=patient_info.date_of_birth,
             db_tool=patient_db
@@ -185,6 +257,8 @@ def patient_lookup_node(state: AgentState):
             "content": f"Thank you! It seems this is your first time with us. Welcome! Let me check available appointment slots for Dr. {patient_info.preferred_doctor} at {patient_info.preferred_location}."
         })
         state['conversation_stage'] = 'find_slots'
+    finally:
+        await refresh
     return state
 
 def find_slots_node(state: AgentState):
@@ -194,11 +268,13 @@ def find_slots_node(state: AgentState):
     end_date = start_date + timedelta(days=14)
     
     calendar_tool._load_booked_slots()
-    available_slots = calendar_tool.find_available_slots(is_new, start_date, end_date)
+    available_slots = calendar_tool.find_available_slots(
+        is_new, start_date, end_date, doctor_name=state['patient_info'].preferred_doctor
+    )
     state['available_slots'] = available_slots
     
     if available_slots:
-        slots_str = "\n".join([f"{i+1}. {s}" for i, s in enumerate(available_slots[:5])])
+        slots_str = "\n".join([f"{i+1}. {s}" for i, s in enumerate(available_slots)])
         duration = "60 minutes" if is_new else "30 minutes"
         patient_info = state['patient_info']
         state['messages'].append({
@@ -215,51 +291,31 @@ def find_slots_node(state: AgentState):
         state['conversation_stage'] = 'completed'
     return state
 
-def selection_parser_node(state: AgentState):
+async def selection_parser_node(state: AgentState):
     print("---NODE: SELECTION PARSER---")
     
     # Get the latest user message (the user's selection)
-    last_user_message = None
-    for msg in reversed(state['messages']):
-        if msg['role'] == 'user':
-            last_user_message = msg['content']
-            break
-    
-    # Format available slots for the prompt
-    slots_str = "\n".join([f"{i+1}. {s}" for i, s in enumerate(state['available_slots'])])
+    last_user_message = state.get('last_user_message')
     
-    # Invoke the selection parser with expected variables
-    result = selection_parser_chain.invoke({
-        "available_slots": slots_str,
-        "user_message": last_user_message or ""
-    })
-    
-    # Extract possible keys
-    slot_number = (
-        result.get('slotNumber') or 
-        result.get('slot_number') or 
-        result.get('number')
-    )
-    selected_slot = (
-        result.get('selectedSlot') or 
-        result.get('selected_slot') or 
-        result.get('slot')
-    )
-    
-    # If we have a valid slot number, map it to the actual slot
-    if isinstance(slot_number, int) and 1 <= slot_number <= len(state['available_slots']):
-        state['chosen_slot'] = state['available_slots'][slot_number - 1]
+    # "2" or "slot 2" maps straight to a slot; only free-form replies need the LLM.
+    selection = match_slot_number(last_user_message, state['available_slots'])
+    if selection is None:
+        # Format available slots for the prompt
+        slots_str = "\n".join([f"{i+1}. {s}" for i, s in enumerate(state['available_slots'])])
+        
+        # Invoke the selection parser with expected variables
+        result = await selection_parser_chain.ainvoke({
+            "available_slots": slots_str,
+            "user_message": last_user_message or ""
+        })
+        
+        # Map the parsed number/text onto one of the offered slots
+        selection = normalize_selection_result(result, state['available_slots'])
+    if selection['selected_slot'] != "AMBIGUOUS":
+        state['chosen_slot'] = selection['selected_slot']
         state['conversation_stage'] = 'confirmation'
         return state
     
-    # Try to use selected slot text if unambiguous
-    if selected_slot and selected_slot != "AMBIGUOUS":
-        for i, slot in enumerate(state['available_slots']):
-            if selected_slot in slot or slot in selected_slot:
-                state['chosen_slot'] = slot
-                state['conversation_stage'] = 'confirmation'
-                return state
-    
     # If ambiguous, ask user to clarify
     state['messages'].append({
         "role": "assistant",
@@ -292,21 +348,22 @@ def confirmation_node(state: AgentState):
         state['conversation_stage'] = 'find_slots'
     return state
 
-def email_collection_node(state: AgentState):
+async def email_collection_node(state: AgentState):
     print("---NODE: EMAIL COLLECTION---")
+    last_user_message = state.get('last_user_message')
+    
+    # Regex fast path on the latest message; the LLM only sees the history if that fails.
     history = format_history(state['messages'])
-    raw_info = insurance_parser_chain.invoke({"conversation_history": history})
-    insurance_info = normalize_and_validate_insurance_info(raw_info)
+    insurance_info = await aparse_insurance(last_user_message or "", insurance_parser_chain, history)
     
     if insurance_info.patient_email:
         state['patient_email'] = insurance_info.patient_email
-        # Initialize and use the email tool
-        email_tool = EmailTools(settings.SMTP_SERVER, settings.SMTP_PORT, settings.EMAIL_ADDRESS, settings.EMAIL_PASSWORD)
-        email_tool.send_form_email(
+        # The confirmation doesn't depend on SMTP, so the form is sent in the background.
+        run_in_background(email_tool.send_form_email_async(
             recipient_email=insurance_info.patient_email,
             patient_name=state['patient_info'].full_name,
             attachment_path=settings.INTAKE_FORM_PATH
-        )
+        ))
         patient_info = state['patient_info']
         state['messages'].append({
             "role": "assistant", 
@@ -324,23 +381,23 @@ def route_conversation(state: AgentState) -> str:
     """
     Routes the conversation based on current stage and last message.
     """
-    print(f"---ROUTER: Current stage = {state.get('conversation_stage', 'greeting')}---")
-    
     stage = state.get('conversation_stage', 'greeting')
+    print(f"---ROUTER: Current stage = {stage}---")
     
-    # Special handling: if we're moving to find_slots, don't wait for user input
-    if stage == 'find_slots':
-        return 'find_slots'
-    
-    # For all other stages, only proceed if the last message is from user
-    if state.get('messages') and state['messages'][-1]['role'] == 'assistant':
-        return END
-    
-    return stage
+    match stage:
+        # Special handling: if we're moving to find_slots, don't wait for user input
+        case 'find_slots':
+            return 'find_slots'
+        # For all other stages, only proceed if the last message is from user
+        case _ if state.get('messages') and state['messages'][-1]['role'] == 'assistant':
+            return END
+        case _:
+            return stage
 
 # --- 5. Build the Graph ---
 workflow = StateGraph(AgentState)
 
+workflow.add_node("ingest", ingest_node)
 workflow.add_node("greeting", greeting_node)
 workflow.add_node("information_confirmation", information_confirmation_node)
 workflow.add_node("patient_lookup", patient_lookup_node)
@@ -350,7 +407,8 @@ workflow.add_node("confirmation", confirmation_node)
 workflow.add_node("email_collection", email_collection_node)
 
 # This is the routing map that will be used for all conditional edges.
-router_map = {
+# Built once and read-only; LangGraph takes its own copy when the edges are added.
+ROUTER_MAP = MappingProxyType({
     "greeting": "greeting",
     "information_confirmation": "information_confirmation",
     "patient_lookup": "patient_lookup",
@@ -360,21 +418,68 @@ router_map = {
     "email_collection": "email_collection",
     "completed": END,
     END: END,
-}
+})
 
-workflow.set_conditional_entry_point(route_conversation, router_map)
+workflow.set_entry_point("ingest")
 
-# After each node completes, it updates the stage and goes back to the router
-# which then directs it to the next appropriate node.
-for node_name in router_map.keys():
-    if node_name not in [END, "completed"]: # END is not a real node
-        workflow.add_conditional_edges(node_name, route_conversation, router_map)
+# After each node (ingest included) completes, it updates the stage and goes back
+# to the router which then directs it to the next appropriate node.
+for node_name in workflow.nodes:
+    workflow.add_conditional_edges(node_name, route_conversation, dict(ROUTER_MAP))
 
 app = workflow.compile()
 
-# --- 6. Test the Integrated Graph ---
+# --- 6. Run the Graph from Synchronous Code ---
+# Some nodes are async, so the graph is driven with `app.ainvoke`. Every call runs on
+# one long-lived event loop: the pooled async HTTP client is bound to the loop it
+# first ran on, so a fresh `asyncio.run()` per turn would break its connections.
+_event_loop = asyncio.new_event_loop()
+threading.Thread(target=_event_loop.run_forever, name="agent-event-loop", daemon=True).start()
+
+def run_async(coro):
+    """Runs a coroutine on the shared event loop and blocks until it returns."""
+    return asyncio.run_coroutine_threadsafe(coro, _event_loop).result()
+
+async def _prewarm_llm_connection():
+    """Opens the TLS + HTTP/2 connection to the LLM provider before the first real request."""
+    try:
+        await _http_async_client.get(f"{settings.OPENROUTER_BASE_URL}/models", timeout=10)
+    except Exception as e:
+        print(f"⚠️ Could not pre-warm the LLM connection: {e}")
+
+# Fire and forget: the request runs on the shared loop while the rest of the app starts.
+if settings.OPENROUTER_API_KEY:
+    asyncio.run_coroutine_threadsafe(_prewarm_llm_connection(), _event_loop)
+
+def invoke_app(state: AgentState, config=None) -> AgentState:
+    """Synchronous entry point for callers like Streamlit: one conversation turn."""
+    return run_async(app.ainvoke(state, config))
+
+async def astream_app(state: AgentState, config=None, on_token=None, on_node_end=None) -> AgentState:
+    """
+    Runs one turn like `app.ainvoke`, reporting progress while it runs.
+
+    `on_token(text)` receives LLM output chunks as they stream in and
+    `on_node_end(name)` is called as each graph node finishes. Returns the
+    final state.
+    """
+    result = None
+    async for event in app.astream_events(state, config, version="v2"):
+        kind, name = event["event"], event["name"]
+        if kind == "on_chat_model_stream" and on_token:
+            on_token(event["data"]["chunk"].content)
+        elif kind == "on_chain_end" and name in workflow.nodes and on_node_end:
+            on_node_end(name)
+        elif kind == "on_chain_end" and name == "LangGraph":
+            result = event["data"]["output"]
+    return result
+
+# --- 7. Test the Integrated Graph ---
 if __name__ == "__main__":
+    import logging
     import pandas as pd
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger(__name__)
     logger.info("🚀 Compiling the integrated agent graph...")
     
     try:
@@ -421,15 +526,20 @@ if __name__ == "__main__":
         }
     ]
     
+    # Each turn sends the state returned by the previous one, like app.py does
+    result = {"messages": []}
     for i, turn in enumerate(conversation_turns, 1):
         logger.info(f"\n--- TURN {i}: {turn['description']} ---")
         logger.info(f"👤 USER: {turn['user_input']}")
         
         try:
-            # Invoke the conversation
-            result = app.invoke({
-                "messages": [{"role": "user", "content": turn['user_input']}]
-            }, config)
+            # Invoke the conversation, printing LLM tokens as they stream in
+            result = run_async(astream_app(
+                {**result, "messages": result['messages'] + [{"role": "user", "content": turn['user_input']}]},
+                config,
+                on_token=lambda text: print(text, end="", flush=True),
+                on_node_end=lambda name: print(f"\n✔️ {name} done"),
+            ))
             
             # Get the latest assistant message
             if result['messages']:
@@ -474,4 +584,45 @@ if __name__ == "__main__":
     except Exception as e:
         logger.error(f"⚠️ Error checking appointments: {e}")
 
+    # --- LOAD TEST: independent conversations run concurrently ---
+    # Only the turns up to the slot list are replayed, so the parallel runs don't
+    # book appointments or send emails.
+    import time
+    import statistics
+    from agents._llm_cache import bypass_response_cache
+
+    NUM_PARALLEL_CONVERSATIONS = 8
+    benchmark_turns = conversation_turns[:4]
+
+    async def run_conversation(thread_id: str) -> List[float]:
+        """Plays `benchmark_turns` in order and returns each turn's latency in seconds."""
+        state, latencies = {"messages": []}, []
+        for turn in benchmark_turns:
+            state = {**state, "messages": state['messages'] + [{"role": "user", "content": turn['user_input']}]}
+            started = time.perf_counter()
+            state = await app.ainvoke(state, {"configurable": {"thread_id": thread_id}})
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    async def run_load_test() -> List[List[float]]:
+        thread_ids = [f"load-test-{n}" for n in range(NUM_PARALLEL_CONVERSATIONS)]
+        # The turns above already filled the response cache with these exact inputs;
+        # bypass it so the numbers measure the graph and the LLM, not cache lookups.
+        with bypass_response_cache():
+            return await asyncio.gather(*(run_conversation(tid) for tid in thread_ids))
+
+    logger.info(f"\n--- LOAD TEST: {NUM_PARALLEL_CONVERSATIONS} parallel conversations ---")
+    try:
+        started = time.perf_counter()
+        per_conversation = run_async(run_load_test())
+        wall_time = time.perf_counter() - started
+
+        turn_latencies = sorted(latency for latencies in per_conversation for latency in latencies)
+        p50 = statistics.median(turn_latencies)
+        p95 = statistics.quantiles(turn_latencies, n=20, method="inclusive")[-1]
+        print(f"⏱️ {len(turn_latencies)} turns in {wall_time:.2f}s "
+              f"({len(turn_latencies) / wall_time:.1f} turns/s) | p50 {p50 * 1000:.0f} ms | p95 {p95 * 1000:.0f} ms")
+    except Exception as e:
+        logger.error(f"❌ Load test failed: {e}")
+
     print("\n🎉 Extended conversation flow test completed!")
\ No newline at end of file
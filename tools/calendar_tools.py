@@ -1,12 +1,90 @@
 # tools/calendar_tools.py
 # This tool handles reading doctor schedules and finding available appointment slots.
 
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 import sys
 import os
+import threading
 import re
 
+# --- FIX FOR DIRECT EXECUTION ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+# --- END FIX ---
+
+from utils.frame_cache import read_csv_arrow, read_excel_cached
+
+try:
+    import numba  # Optional: compiles the slot enumeration loop to machine code.
+except ImportError:
+    numba = None
+
+def _prepare_schedule(df):
+    # Convert schedule times to datetime objects
+    df['start_datetime'] = pd.to_datetime(df['date'].astype(str) + ' ' + df['start_time'].astype(str))
+    df['end_datetime'] = pd.to_datetime(df['date'].astype(str) + ' ' + df['end_time'].astype(str))
+    return df
+
+def _doctor_key(name) -> str:
+    """'Dr. Smith', 'dr smith' and 'Smith' all map to 'smith'."""
+    return re.sub(r'^dr\.?\s+', '', " ".join(str(name).lower().split()))
+
+def _free_slot_starts_numpy(block_starts, block_ends, duration, booked, limit):
+    """
+    Enumerates the first `limit` appointment starts that fit in the schedule blocks
+    and are not in `booked`, in block order. All times are int64 seconds; `booked`
+    is sorted. Returns (slot starts, index of the block each slot came from).
+    """
+    # Number of whole appointments that fit in each schedule block
+    counts = np.maximum((block_ends - block_starts) // duration, 0)
+
+    # Every candidate slot start across all blocks: block start + k * duration
+    block_of_slot = np.repeat(np.arange(len(counts)), counts)
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    slot_starts = block_starts[block_of_slot] + k * duration
+
+    # --- CONFLICT PREVENTION CHECK ---
+    # Drop every start time that is already booked (binary search in the sorted array).
+    if len(booked):
+        idx = np.searchsorted(booked, slot_starts)
+        free = booked[np.minimum(idx, len(booked) - 1)] != slot_starts
+        slot_starts, block_of_slot = slot_starts[free], block_of_slot[free]
+    return slot_starts[:limit], block_of_slot[:limit]
+
+def _free_slot_starts_loop(block_starts, block_ends, duration, booked, limit):
+    """
+    Same contract as _free_slot_starts_numpy, as one fused loop for numba to
+    compile; it stops as soon as `limit` free slots are found.
+    """
+    total = 0
+    for b in range(len(block_starts)):
+        total += max((block_ends[b] - block_starts[b]) // duration, 0)
+    total = min(total, limit)
+    slot_starts = np.empty(total, dtype=np.int64)
+    block_of_slot = np.empty(total, dtype=np.int64)
+
+    n = 0
+    for b in range(len(block_starts)):
+        start = block_starts[b]
+        while n < total and start + duration <= block_ends[b]:
+            i = np.searchsorted(booked, start)
+            if i == len(booked) or booked[i] != start:
+                slot_starts[n] = start
+                block_of_slot[n] = b
+                n += 1
+            start += duration
+    return slot_starts[:n], block_of_slot[:n]
+
+# The compiled loop needs no temporary arrays; without numba, NumPy does the same work.
+if numba is not None:
+    _free_slot_starts = numba.njit(cache=True, nogil=True)(_free_slot_starts_loop)
+else:
+    _free_slot_starts = _free_slot_starts_numpy
+
 class CalendarTools:
     def __init__(self, schedules_filepath: str, appointments_filepath: str, appointment_durations: dict):
         """
@@ -20,10 +98,17 @@ class CalendarTools:
         self.appointment_durations = appointment_durations
         self.appointments_file = appointments_filepath
         try:
-            self.df = pd.read_excel(schedules_filepath)
-            # Convert schedule times to datetime objects
-            self.df['start_datetime'] = pd.to_datetime(self.df['date'].astype(str) + ' ' + self.df['start_time'].astype(str))
-            self.df['end_datetime'] = pd.to_datetime(self.df['date'].astype(str) + ' ' + self.df['end_time'].astype(str))
+            # The parsed schedule is cached as Parquet next to the Excel file and rebuilt
+            # whenever the workbook's mtime differs from the one the copy was built from.
+            self.df = read_excel_cached(schedules_filepath, prepare=_prepare_schedule)
+            # Plain NumPy columns for the vectorized slot enumeration
+            self._block_starts = self.df['start_datetime'].to_numpy(dtype='datetime64[s]')
+            self._block_ends = self.df['end_datetime'].to_numpy(dtype='datetime64[s]')
+            self._block_doctors = self.df['doctor_name'].to_numpy(dtype=object)
+            # Block positions per doctor, so one doctor's slots never touch the other blocks
+            self._blocks_by_doctor = {
+                _doctor_key(name): positions for name, positions in self.df.groupby('doctor_name').indices.items()
+            }
         except FileNotFoundError:
             print(f"Error: The schedule file '{schedules_filepath}' was not found.")
             sys.exit(1)
@@ -31,62 +116,96 @@ class CalendarTools:
             print(f"Error loading or processing the Excel file: {e}")
             sys.exit(1)
 
+        self._apps_mtime = None
+        self._booked_lock = threading.Lock()
         self._load_booked_slots()
 
     def _load_booked_slots(self):
         """
         Loads already booked appointments to prevent double booking.
-        Creates a set of datetime objects for quick lookup.
+        Stores them as a sorted datetime64 array for vectorized lookups.
+        The file is only re-read when its modification time has changed.
         """
-        self.booked_slots = set()
-        try:
-            if os.path.exists(self.appointments_file):
-                app_df = pd.read_csv(self.appointments_file)
-                for _, row in app_df.iterrows():
-                    booked_time = pd.to_datetime(f"{row['appointment_date']} {row['appointment_time']}")
-                    self.booked_slots.add(booked_time)
-        except Exception as e:
-            print(f"Warning: Could not load booked appointments. {e}")
+        # One refresh at a time; callers on other threads (Streamlit sessions, the
+        # load test) wait for it instead of reading a half-built result.
+        with self._booked_lock:
+            try:
+                apps_mtime = os.stat(self.appointments_file).st_mtime_ns
+            except OSError:
+                apps_mtime = None
+            if apps_mtime is not None and apps_mtime == self._apps_mtime:
+                return
+
+            booked_slots_np = np.empty(0, dtype='datetime64[s]')
+            try:
+                if apps_mtime is not None:
+                    # Only the two timestamp columns, read as strings
+                    app_df = read_csv_arrow(self.appointments_file, usecols=['appointment_date', 'appointment_time'])
+                    # ExportTools writes '%Y-%m-%d' + '%H:%M:%S'; a fixed format skips per-row inference,
+                    # and malformed rows become NaT and are dropped.
+                    booked = pd.to_datetime(
+                        app_df['appointment_date'] + ' ' + app_df['appointment_time'],
+                        format='%Y-%m-%d %H:%M:%S', errors='coerce'
+                    ).dropna()
+                    booked_slots_np = np.sort(booked.to_numpy(dtype='datetime64[s]'))
+            except Exception as e:
+                # Leave the mtime unset so the next call retries the read
+                apps_mtime = None
+                print(f"Warning: Could not load booked appointments. {e}")
 
-    def find_available_slots(self, is_new_patient: bool, start_date: datetime, end_date: datetime) -> list:
+            # Publish the array before the mtime: a caller that sees the new mtime
+            # and skips the refresh always finds the matching booked slots.
+            self.booked_slots_np = booked_slots_np
+            self._apps_mtime = apps_mtime
+
+    def _doctor_blocks(self, doctor_name):
+        """Schedule block positions for `doctor_name`, or every block if no known doctor is given."""
+        if not doctor_name:
+            return slice(None)
+        positions = self._blocks_by_doctor.get(_doctor_key(doctor_name))
+        if positions is None:
+            print(f"Warning: No schedule found for '{doctor_name}'. Showing all doctors.")
+            return slice(None)
+        return positions
+
+    def find_available_slots(
+        self, is_new_patient: bool, start_date: datetime, end_date: datetime,
+        doctor_name: str = None, max_results: int | None = 5,
+    ) -> list:
         """
         Finds available appointment slots, excluding any that are already booked.
+        Only `doctor_name`'s slots are returned when it matches a doctor in the schedule.
+        At most `max_results` (earliest in schedule order) are returned; None returns all.
         """
         duration_key = "new_patient" if is_new_patient else "returning_patient"
         duration_minutes = self.appointment_durations[duration_key]
-        appointment_duration = timedelta(minutes=duration_minutes)
-        
-        available_slots = []
-
-        mask = (self.df['start_datetime'] >= start_date) & (self.df['start_datetime'] < end_date)
-        relevant_schedule = self.df.loc[mask]
-
-        for _, row in relevant_schedule.iterrows():
-            slot_start = row['start_datetime']
-            block_end = row['end_datetime']
-
-            while slot_start + appointment_duration <= block_end:
-                # --- CONFLICT PREVENTION CHECK ---
-                # Check if this specific start time is already in our set of booked slots.
-                if slot_start not in self.booked_slots:
-                    formatted_slot = (
-                        f"{row['doctor_name']} on {slot_start.strftime('%A, %B %d')} "
-                        f"at {slot_start.strftime('%I:%M %p')}"
-                    )
-                    available_slots.append(formatted_slot)
-                
-                slot_start += appointment_duration
-        
-        return available_slots
+        appointment_duration = np.timedelta64(duration_minutes, 'm')
+
+        blocks = self._doctor_blocks(doctor_name)
+        block_starts = self._block_starts[blocks]
+        block_ends = self._block_ends[blocks]
+        block_doctors = self._block_doctors[blocks]
+
+        mask = (block_starts >= np.datetime64(start_date)) & (block_starts < np.datetime64(end_date))
+
+        # Enumerate and conflict-check in int64 seconds (datetime64[s] viewed without a copy)
+        slot_starts, block_of_slot = _free_slot_starts(
+            block_starts[mask].view(np.int64),
+            block_ends[mask].view(np.int64),
+            appointment_duration.astype('timedelta64[s]').astype(np.int64),
+            self.booked_slots_np.view(np.int64),
+            np.iinfo(np.int64).max if max_results is None else max_results,
+        )
+        if not len(slot_starts):
+            return []
+        slot_doctors = block_doctors[mask][block_of_slot]
+
+        # Format only the surviving slots, e.g. "Dr. Smith on Monday, September 08 at 10:30 AM"
+        when = pd.DatetimeIndex(slot_starts.astype('datetime64[s]')).strftime(' on %A, %B %d at %I:%M %p')
+        return [doctor + suffix for doctor, suffix in zip(slot_doctors, when)]
 
 # --- Example Usage & Testing ---
 if __name__ == '__main__':
-    # --- FIX FOR DIRECT EXECUTION ---
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.dirname(current_dir)
-    sys.path.append(project_root)
-    # --- END FIX ---
-
     # --- LOCAL IMPORTS ---
     from config import settings
     # --- END LOCAL IMPORTS ---
@@ -103,7 +222,7 @@ if __name__ == '__main__':
         appointments_filepath=settings.APPOINTMENTS_CSV_PATH,
         appointment_durations=settings.APPOINTMENT_DURATIONS
     )
-    new_patient_slots = calendar.find_available_slots(True, today, next_week)
+    new_patient_slots = calendar.find_available_slots(True, today, next_week, max_results=None)
     assert len(new_patient_slots) > 0
     print("✅ Basic slot finding tests passed.")
 
@@ -137,7 +256,7 @@ if __name__ == '__main__':
     )
     
     # Find slots again
-    slots_after_booking = conflict_calendar.find_available_slots(True, today, next_week)
+    slots_after_booking = conflict_calendar.find_available_slots(True, today, next_week, max_results=None)
 
     print(f"Slot to check: '{first_available_slot}'")
     print(f"Original slot count: {len(new_patient_slots)}")
@@ -1,8 +1,27 @@
 # tools/database_tools.py
 # This file contains functions for interacting with the mock patient database.
 
+import numpy as np
 import pandas as pd
-from thefuzz import process
+from rapidfuzz import fuzz, process, utils as fuzz_utils
+import sys
+import os
+from typing import List, Optional, Tuple
+
+# --- FIX FOR DIRECT EXECUTION ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+# --- END FIX ---
+
+from utils.frame_cache import read_csv_arrow
+from utils.helpers import iso_to_u32
+from utils.validators import is_valid_full_name_series
+
+def _name_key(name: str) -> str:
+    """'  SANDRA   chaney. ' -> 'sandra chaney': case, spacing and punctuation never matter."""
+    return " ".join(fuzz_utils.default_process(name or "").split())
 
 # Note: We will import 'settings' later, inside the test block,
 # to solve the path issue for direct script execution.
@@ -15,14 +34,52 @@ class PatientDB:
         Initializes the PatientDB by loading the patient data from a CSV file.
         """
         try:
-            self.df = pd.read_csv(filepath)
-            # Ensure date_of_birth is a string for consistent comparison
-            self.df['date_of_birth'] = self.df['date_of_birth'].astype(str)
+            # Read once at startup with the pyarrow parser; lookups use the indexes below.
+            # Text columns (date_of_birth included) stay as Arrow strings, no per-row str objects.
+            self.df = read_csv_arrow(filepath, arrow_strings=True)
+            # Visit counts are small; the narrowest integer type keeps the column (and its index) compact
+            self.df['visit_history'] = pd.to_numeric(self.df['visit_history'], downcast='integer')
+            # Built once here instead of on every search
+            self.df['full_name'] = self.df['first_name'] + ' ' + self.df['last_name']
+            # Flag malformed names once at load; they can only be found by fuzzy match luck
+            invalid_names = int((~is_valid_full_name_series(self.df['full_name'])).sum())
+            if invalid_names:
+                print(f"⚠️ {invalid_names} patient record(s) have a missing or malformed name.")
             print("✅ Patient database loaded successfully.")
         except FileNotFoundError:
             print(f"❌ ERROR: Patient data file not found at {filepath}")
             self.df = pd.DataFrame()
 
+        self._build_indexes()
+
+    def _build_indexes(self):
+        """
+        Builds hash indexes once so exact lookups don't scan the DataFrame.
+        """
+        self._by_name_dob = {}
+        self._by_pid = {}
+        self._names_processed = []
+        if self.df.empty:
+            return
+
+        # Rows are kept as plain tuples (missing values as None) and only turned
+        # into a dict for the record a search actually returns.
+        self._columns = list(self.df.columns)
+        columns = {column: self.df[column].to_numpy(dtype=object, na_value=None) for column in self._columns}
+        self._rows = list(zip(*columns.values()))
+
+        # DOBs are keyed as YYYYMMDD integers (see iso_to_u32), not strings
+        for position, (name, dob) in enumerate(zip(columns['full_name'], columns['date_of_birth'])):
+            key = (_name_key(name), iso_to_u32(dob))
+            self._by_name_dob.setdefault(key, position)
+        self._by_pid = {pid: position for position, pid in enumerate(columns['patient_id'])}
+        self._visit_history = self.df['visit_history'].to_numpy()
+        # Fuzzy-match choices, already lower-cased and stripped of punctuation
+        self._names_processed = [_name_key(name) for name in columns['full_name']]
+
+    def _record(self, position: int) -> dict:
+        return dict(zip(self._columns, self._rows[position]))
+
     def search_patient(self, full_name: str, dob: str):
         """
         Searches for a patient by full name and date of birth using fuzzy matching for the name.
@@ -37,63 +94,99 @@ class PatientDB:
         if self.df.empty:
             return None
 
-        # Create a 'full_name' column for easier searching
-        self.df['full_name'] = self.df['first_name'] + ' ' + self.df['last_name']
-        
+        # --- Exact Match Fast Path ---
+        # Any spelling that only differs in case, spacing or punctuation is a dict hit.
+        query_key = _name_key(full_name)
+        # A DOB that is not a valid YYYY-MM-DD date becomes None and never matches
+        dob_key = iso_to_u32(dob)
+        position = self._by_name_dob.get((query_key, dob_key)) if dob_key is not None else None
+        if position is not None:
+            print(f"✅ Patient found for '{full_name}' and DOB '{dob}'.")
+            return self._record(position)
+
         # --- Fuzzy Name Matching ---
-        names = self.df['full_name'].tolist()
-        best_match = process.extractOne(full_name, names, score_cutoff=80)
+        # Same scorer and preprocessing as thefuzz's defaults, computed in C++ by rapidfuzz;
+        # the choices were preprocessed once, so only the query is processed here.
+        best_match = process.extractOne(
+            query_key, self._names_processed,
+            scorer=fuzz.WRatio, processor=None, score_cutoff=80
+        )
         
         if not best_match:
             print(f"No close name match found for '{full_name}'.")
             return None
             
-        matched_name = best_match[0]
+        _, _, matched_index = best_match
+        matched_name = self.df['full_name'].iat[matched_index]
         
         # --- DOB and Name Matching ---
-        patient_record = self.df[
-            (self.df['full_name'] == matched_name) & 
-            (self.df['date_of_birth'] == dob)
-        ]
+        # One hash lookup covers every patient sharing the matched name.
+        position = self._by_name_dob.get((_name_key(matched_name), dob_key)) if dob_key is not None else None
 
-        if not patient_record.empty:
+        if position is not None:
             print(f"✅ Patient found for '{full_name}' and DOB '{dob}'.")
-            return patient_record.iloc[0].to_dict()
+            return self._record(position)
         else:
             print(f"Patient with name match '{matched_name}' found, but DOB '{dob}' does not match.")
             return None
 
+    def search_patients_bulk(self, queries: List[Tuple[str, str]]) -> List[Optional[dict]]:
+        """
+        search_patient for many (full_name, dob) pairs at once.
+
+        Exact matches are dict hits; all remaining names are scored against every
+        patient in one rapidfuzz cdist call (in C++, across all cores).
+
+        Returns:
+            One record (or None) per query, in order.
+        """
+        results = [None] * len(queries)
+        if self.df.empty or not queries:
+            return results
+
+        fuzzy_rows, fuzzy_keys = [], []
+        for row, (full_name, dob) in enumerate(queries):
+            query_key = _name_key(full_name)
+            dob_key = iso_to_u32(dob)
+            if dob_key is None:
+                continue
+            position = self._by_name_dob.get((query_key, dob_key))
+            if position is not None:
+                results[row] = self._record(position)
+            else:
+                fuzzy_rows.append((row, dob_key))
+                fuzzy_keys.append(query_key)
+
+        if fuzzy_keys:
+            # Scores under the cutoff come back as 0; argmax picks the first best
+            # match, the same one extractOne would return.
+            scores = process.cdist(
+                fuzzy_keys, self._names_processed,
+                scorer=fuzz.WRatio, processor=None, score_cutoff=80, workers=-1
+            )
+            best = scores.argmax(axis=1)
+            for (row, dob_key), matched_index, score in zip(fuzzy_rows, best, scores[np.arange(len(best)), best]):
+                if score < 80:
+                    continue
+                position = self._by_name_dob.get((self._names_processed[matched_index], dob_key))
+                if position is not None:
+                    results[row] = self._record(position)
+
+        print(f"✅ Bulk search matched {sum(r is not None for r in results)} of {len(queries)} patients.")
+        return results
+
     def is_returning_patient(self, patient_id: str) -> bool:
         """
         Checks if a patient is a returning patient based on their visit history.
         """
-        if self.df.empty:
-            return False
-            
-        patient_record = self.df[self.df['patient_id'] == patient_id]
-        
-        if not patient_record.empty:
-            visit_history = patient_record.iloc[0]['visit_history']
-            return visit_history > 0
-        
-        return False
+        position = self._by_pid.get(patient_id)
+        return position is not None and bool(self._visit_history[position] > 0)
 
 # Example usage for testing
 if __name__ == '__main__':
-    # --- FIX FOR DIRECT EXECUTION ---
-    # This block allows the script to be run directly for testing purposes.
-    # It adds the project's root directory to Python's path, so it can find 'config'.
-    import sys
-    import os
-    # Get the absolute path of the current file's directory (tools)
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    # Get the parent directory (the project root, ai-scheduling-agent)
-    project_root = os.path.dirname(current_dir)
-    # Add the project root to the system path
-    sys.path.append(project_root)
-    
+    # --- LOCAL IMPORTS ---
     from config import settings
-    # --- END FIX ---
+    # --- END LOCAL IMPORTS ---
 
     # Now we can initialize the DB using the path from our settings file
     db = PatientDB(filepath=settings.PATIENTS_CSV_PATH)
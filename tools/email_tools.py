@@ -2,21 +2,116 @@
 # This tool handles sending emails with attachments, such as the patient intake form.
 
 import smtplib
+import aiosmtplib
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
 import os
 import sys
+import threading
+import time
+
+class PersistentSMTP:
+    """
+    One long-lived, logged-in SMTP connection that many sends can share, so the
+    STARTTLS + AUTH handshake is paid once instead of per message.
+    """
+    # Idle connections are checked with NOOP before reuse; servers drop them silently.
+    KEEPALIVE_SECONDS = 30
 
-class EmailTools:
     def __init__(self, smtp_server, port, sender_email, password):
+        self.smtp_server = smtp_server
+        self.port = port
+        self.sender_email = sender_email
+        self.password = password
+        self._server = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        server = smtplib.SMTP(self.smtp_server, self.port)
+        server.starttls()
+        server.login(self.sender_email, self.password)
+        return server
+
+    def _close_quietly(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+            self._server = None
+
+    def _reconnect_if_broken(self):
+        if self._server is not None and time.monotonic() - self._last_used > self.KEEPALIVE_SECONDS:
+            try:
+                if self._server.noop()[0] != 250:
+                    self._close_quietly()
+            except (smtplib.SMTPException, OSError):
+                self._close_quietly()
+        if self._server is None:
+            self._server = self._connect()
+
+    def _send_locked(self, msg, to_addrs=None):
+        self._reconnect_if_broken()
+        try:
+            self._server.send_message(msg, to_addrs=to_addrs)
+        except smtplib.SMTPServerDisconnected:
+            # Dropped since the last check: reconnect once and retry.
+            self._close_quietly()
+            self._server = self._connect()
+            self._server.send_message(msg, to_addrs=to_addrs)
+        self._last_used = time.monotonic()
+
+    def send_message(self, msg, to_addrs=None):
+        with self._lock:
+            self._send_locked(msg, to_addrs=to_addrs)
+
+    def send_messages(self, msgs):
+        """
+        Sends several messages back to back over the connection, holding it for
+        the whole batch. Returns how many were sent; a failed message is
+        reported and skipped.
+        """
+        sent = 0
+        with self._lock:
+            for msg in msgs:
+                try:
+                    self._send_locked(msg)
+                    sent += 1
+                except Exception as e:
+                    print(f"❌ Failed to send email to {msg['To']}: {e}")
+        return sent
+
+    def close(self):
+        with self._lock:
+            self._close_quietly()
+
+
+class EmailTools:
+    def __init__(self, smtp_server, port, sender_email, password, smtp_connection: PersistentSMTP = None):
         """
         Initializes the EmailTools with SMTP server configuration.
+
+        Emails go over one persistent connection, opened on the first send and
+        reused afterwards. Pass `smtp_connection` to share a connection between
+        several EmailTools; otherwise this instance keeps its own.
         """
         self.smtp_server = smtp_server
         self.port = port
         self.sender_email = sender_email
         self.password = password
+        self._owns_connection = smtp_connection is None
+        self.smtp_connection = smtp_connection or PersistentSMTP(smtp_server, port, sender_email, password)
+
+    def _send(self, msg, to_addrs=None):
+        self.smtp_connection.send_message(msg, to_addrs=to_addrs)
+
+    def close(self):
+        """Closes the SMTP connection, unless it was passed in (its owner closes it)."""
+        if self._owns_connection:
+            self.smtp_connection.close()
 
     def send_form_email(self, recipient_email: str, patient_name: str, attachment_path: str) -> bool:
         """
@@ -28,23 +123,9 @@ class EmailTools:
             return False
 
         try:
-            msg = MIMEMultipart()
-            msg['From'] = self.sender_email
-            msg['To'] = recipient_email
-            msg['Subject'] = "Your Upcoming Appointment & Patient Intake Form"
-
-            body = f"Dear {patient_name},\n\nPlease find your patient intake form attached.\n\nBest regards,\nClinic Staff"
-            msg.attach(MIMEText(body, 'plain'))
-
-            with open(attachment_path, "rb") as attachment:
-                part = MIMEApplication(attachment.read(), Name=os.path.basename(attachment_path))
-            part['Content-Disposition'] = f'attachment; filename="{os.path.basename(attachment_path)}"'
-            msg.attach(part)
-
-            with smtplib.SMTP(self.smtp_server, self.port) as server:
-                server.starttls()
-                server.login(self.sender_email, self.password)
-                server.send_message(msg)
+            msg = self._build_form_message(recipient_email, patient_name, attachment_path)
+
+            self._send(msg)
             
             print(f"✅ Intake form successfully sent to {recipient_email}")
             return True
@@ -53,6 +134,32 @@ class EmailTools:
             print(f"❌ Failed to send form email: {e}")
             return False
 
+    async def send_form_email_async(self, recipient_email: str, patient_name: str, attachment_path: str) -> bool:
+        """
+        Async variant of send_form_email using aiosmtplib, so the send never
+        blocks the event loop.
+        """
+        if not all([self.sender_email, self.password]):
+            print("❌ Email configuration is missing in .env file. Cannot send email.")
+            return False
+
+        try:
+            msg = self._build_form_message(recipient_email, patient_name, attachment_path)
+            await aiosmtplib.send(
+                msg,
+                hostname=self.smtp_server,
+                port=self.port,
+                start_tls=True,
+                username=self.sender_email,
+                password=self.password,
+            )
+            print(f"✅ Intake form successfully sent to {recipient_email}")
+            return True
+
+        except Exception as e:
+            print(f"❌ Failed to send form email: {e}")
+            return False
+
     def send_reminder_email(self, recipient_email: str, subject: str, body: str) -> bool:
         """
         Sends a simple text-based reminder email.
@@ -62,16 +169,9 @@ class EmailTools:
             return False
         
         try:
-            msg = MIMEMultipart()
-            msg['From'] = self.sender_email
-            msg['To'] = recipient_email
-            msg['Subject'] = subject
-            msg.attach(MIMEText(body, 'plain'))
+            msg = self._build_reminder_message(recipient_email, subject, body)
             
-            with smtplib.SMTP(self.smtp_server, self.port) as server:
-                server.starttls()
-                server.login(self.sender_email, self.password)
-                server.send_message(msg)
+            self._send(msg)
             
             print(f"✅ Reminder email successfully sent to {recipient_email}")
             return True
@@ -79,6 +179,130 @@ class EmailTools:
             print(f"❌ Failed to send reminder email: {e}")
             return False
 
+    def send_bulk_reminder_email(self, recipient_emails: list, subject: str, body: str) -> bool:
+        """
+        Sends one identical reminder to several recipients in a single SMTP
+        transaction (one DATA, many RCPT TO). Recipients are not listed in the
+        headers, so patients never see each other's addresses.
+        """
+        if len(recipient_emails) < 2:
+            return all([self.send_reminder_email(email, subject, body) for email in recipient_emails])
+
+        if not all([self.sender_email, self.password]):
+            print("❌ Email configuration is missing. Cannot send reminder email.")
+            return False
+
+        try:
+            msg = self._build_reminder_message(self.sender_email, subject, body)
+            self._send(msg, to_addrs=list(recipient_emails))
+            print(f"✅ Reminder email successfully sent to {len(recipient_emails)} recipients")
+            return True
+        except Exception as e:
+            print(f"❌ Failed to send reminder email: {e}")
+            return False
+
+    def send_reminder_batch(self, items: list, max_workers: int = 8) -> list:
+        """
+        Sends many reminders concurrently. `items` are (recipient_email, subject, body)
+        tuples; returns one success flag per item, in order.
+
+        Each worker thread opens its own persistent SMTP connection and reuses it
+        for all of its sends; the connections are closed when the batch is done.
+        """
+        if not all([self.sender_email, self.password]):
+            print("❌ Email configuration is missing. Cannot send reminder email.")
+            return [False] * len(items)
+
+        local = threading.local()
+        connections = []
+
+        def send_one(item):
+            recipient_email, subject, body = item
+            try:
+                connection = getattr(local, 'connection', None)
+                if connection is None:
+                    connection = local.connection = PersistentSMTP(
+                        self.smtp_server, self.port, self.sender_email, self.password
+                    )
+                    connections.append(connection)
+                connection.send_message(self._build_reminder_message(recipient_email, subject, body))
+                print(f"✅ Reminder email successfully sent to {recipient_email}")
+                return True
+            except Exception as e:
+                print(f"❌ Failed to send reminder email: {e}")
+                return False
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                return list(pool.map(send_one, items))
+        finally:
+            for connection in connections:
+                connection.close()
+
+    def send_bulk(self, msgs: list) -> bool:
+        """
+        Sends several prebuilt messages (each with its own recipient) through
+        the one connection. Returns True only if every message was sent.
+        """
+        if not all([self.sender_email, self.password]):
+            print("❌ Email configuration is missing. Cannot send emails.")
+            return False
+
+        sent = self.smtp_connection.send_messages(msgs)
+        print(f"✅ Sent {sent} of {len(msgs)} emails")
+        return sent == len(msgs)
+
+    async def connect_async(self):
+        """
+        Opens one logged-in aiosmtplib connection that can be shared by many
+        send_reminder_email_async calls. Returns None if email is not configured.
+        """
+        if not all([self.sender_email, self.password]):
+            return None
+        smtp = aiosmtplib.SMTP(hostname=self.smtp_server, port=self.port, start_tls=True)
+        await smtp.connect()
+        await smtp.login(self.sender_email, self.password)
+        return smtp
+
+    async def send_reminder_email_async(self, smtp, recipient_email: str, subject: str, body: str) -> bool:
+        """
+        Async variant of send_reminder_email over a connection from connect_async().
+        """
+        if smtp is None:
+            print("❌ Email configuration is missing. Cannot send reminder email.")
+            return False
+
+        try:
+            await smtp.send_message(self._build_reminder_message(recipient_email, subject, body))
+            print(f"✅ Reminder email successfully sent to {recipient_email}")
+            return True
+        except Exception as e:
+            print(f"❌ Failed to send reminder email: {e}")
+            return False
+
+    def _build_form_message(self, recipient_email: str, patient_name: str, attachment_path: str) -> MIMEMultipart:
+        msg = MIMEMultipart()
+        msg['From'] = self.sender_email
+        msg['To'] = recipient_email
+        msg['Subject'] = "Your Upcoming Appointment & Patient Intake Form"
+
+        body = f"Dear {patient_name},\n\nPlease find your patient intake form attached.\n\nBest regards,\nClinic Staff"
+        msg.attach(MIMEText(body, 'plain'))
+
+        with open(attachment_path, "rb") as attachment:
+            part = MIMEApplication(attachment.read(), Name=os.path.basename(attachment_path))
+        part['Content-Disposition'] = f'attachment; filename="{os.path.basename(attachment_path)}"'
+        msg.attach(part)
+        return msg
+
+    def _build_reminder_message(self, recipient_email: str, subject: str, body: str) -> MIMEMultipart:
+        msg = MIMEMultipart()
+        msg['From'] = self.sender_email
+        msg['To'] = recipient_email
+        msg['Subject'] = subject
+        msg.attach(MIMEText(body, 'plain'))
+        return msg
+
 
 # --- Example Usage & Testing ---
 if __name__ == '__main__':
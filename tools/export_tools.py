@@ -3,10 +3,59 @@
 # generating an Excel report for admin review.
 
 import pandas as pd
+import calendar
+import csv
 import os
 import sys
-from datetime import datetime
+from datetime import date, datetime
 import re
+import time
+from openpyxl import Workbook
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# --- FIX FOR DIRECT EXECUTION ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+if project_root not in sys.path:
+    sys.path.append(project_root)
+# --- END FIX ---
+
+from utils.frame_cache import read_csv_arrow
+
+# Column order of appointments.csv; bookings are appended as plain rows in this order.
+APPOINTMENT_COLUMNS = (
+    "appointment_id", "patient_id", "doctor_name",
+    "appointment_date", "appointment_time", "is_new_patient", "status"
+)
+
+# Column order of the admin report.
+REPORT_COLUMNS = (
+    'appointment_id', 'patient_id', 'first_name', 'last_name',
+    'appointment_date', 'appointment_time', 'doctor_name',
+    'status', 'is_new_patient', 'phone', 'email'
+)
+
+# Types of the appointments Parquet log; dates and times stay text, as in the CSV.
+APPOINTMENT_SCHEMA = pa.schema([
+    (column, pa.bool_() if column == "is_new_patient" else pa.string())
+    for column in APPOINTMENT_COLUMNS
+])
+
+# The only patients.csv columns the report uses; the rest are never parsed.
+REPORT_PATIENT_COLUMNS = ('patient_id', 'first_name', 'last_name', 'phone', 'email')
+
+# "Dr. Evelyn Reed on Monday, September 08 at 10:30 AM" -> doctor, date part, time part
+SLOT_STRING_RE = re.compile(r"(Dr\. .+?) on (.+?) at (.+)")
+SLOT_DATE_RE = re.compile(r"(\w+),\s+(\w+)\s+(\d{1,2})")
+SLOT_TIME_RE = re.compile(r"(\d{1,2}):(\d{1,2})\s+([AaPp][Mm])")
+
+# Lookup tables for the names strftime('%A'/'%B') produces, built once.
+WEEKDAY_NAMES = frozenset(name.lower() for name in calendar.day_name)
+MONTH_NUMBERS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+
+# Low-cardinality appointment columns, kept as categories while the report is built.
+REPORT_CATEGORY_COLUMNS = ('doctor_name', 'status', 'is_new_patient')
 
 class ExportTools:
     def __init__(self, appointments_filepath: str, patients_filepath: str, exports_dir: str):
@@ -21,16 +70,74 @@ class ExportTools:
         self.appointments_file = appointments_filepath
         self.patients_file = patients_filepath
         self.exports_dir = exports_dir
-        
-        # Ensure the exports directory exists
-        os.makedirs(self.exports_dir, exist_ok=True)
+        # Append-only Parquet copy of the bookings, so the admin report reads columnar
+        # data instead of re-parsing the CSV. Each booking adds a small file; the
+        # report compacts them into one. The CSV stays the source of truth.
+        self.appointments_log_dir = os.path.splitext(str(appointments_filepath))[0] + "_log"
         
         # Ensure the appointments file exists with headers
         if not os.path.exists(self.appointments_file):
-            pd.DataFrame(columns=[
-                "appointment_id", "patient_id", "doctor_name", 
-                "appointment_date", "appointment_time", "is_new_patient", "status"
-            ]).to_csv(self.appointments_file, index=False)
+            self._append_row(APPOINTMENT_COLUMNS)
+
+    def _append_row(self, row):
+        # Same quoting and line endings as pandas' to_csv, so the file format is unchanged
+        with open(self.appointments_file, 'a', newline='') as f:
+            csv.writer(f, lineterminator=os.linesep).writerow(row)
+
+    def _log_appointments(self, table: pa.Table):
+        # Zero-padded nanosecond names keep the files in booking order; the file is
+        # written under a dot-name (ignored by readers) and renamed once complete.
+        os.makedirs(self.appointments_log_dir, exist_ok=True)
+        name = f"{time.time_ns():020d}.parquet"
+        tmp_path = os.path.join(self.appointments_log_dir, "." + name)
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, os.path.join(self.appointments_log_dir, name))
+
+    def _log_paths(self) -> list:
+        try:
+            names = os.listdir(self.appointments_log_dir)
+        except FileNotFoundError:
+            return []
+        return [
+            os.path.join(self.appointments_log_dir, name)
+            for name in sorted(names) if name.endswith(".parquet") and not name.startswith(".")
+        ]
+
+    def _log_is_current(self, paths: list) -> bool:
+        """
+        The log matches the CSV if it was written after the CSV's last change and
+        holds one row per CSV data line (catches resets and hand edits of the CSV).
+        """
+        if not paths:
+            return False
+        if os.stat(self.appointments_file).st_mtime_ns > max(os.stat(path).st_mtime_ns for path in paths):
+            return False
+        with open(self.appointments_file, 'rb') as f:
+            csv_rows = f.read().count(b"\n") - 1
+        return sum(pq.read_metadata(path).num_rows for path in paths) == csv_rows
+
+    def _read_appointments_log(self) -> pd.DataFrame:
+        """
+        Reads every booking from the Parquet log, rebuilding it from the CSV when
+        it is out of date and compacting the per-booking files into one.
+        """
+        paths = self._log_paths()
+        if not self._log_is_current(paths):
+            if paths:
+                print("⚠️ Appointments log is out of date with the CSV; rebuilding it.")
+            existing = read_csv_arrow(self.appointments_file, usecols=APPOINTMENT_COLUMNS)
+            self._log_appointments(pa.Table.from_pandas(existing, schema=APPOINTMENT_SCHEMA, preserve_index=False))
+            for path in paths:
+                os.remove(path)
+            return existing
+
+        table = pa.concat_tables([pq.read_table(path, schema=APPOINTMENT_SCHEMA) for path in paths])
+        if len(paths) > 1:
+            # Only the files just read are replaced; bookings logged meanwhile stay
+            self._log_appointments(table)
+            for path in paths:
+                os.remove(path)
+        return table.to_pandas()
 
     def _parse_slot_string(self, slot_string: str) -> dict:
         """
@@ -39,23 +146,31 @@ class ExportTools:
         """
         try:
             # Regex to capture the doctor's name, the date part, and the time part
-            match = re.search(r"(Dr\. .+?) on (.+?) at (.+)", slot_string)
+            match = SLOT_STRING_RE.search(slot_string)
             if not match:
                 raise ValueError("Slot string format is incorrect.")
                 
             doctor_name = match.group(1).strip()
-            date_str = match.group(2).strip()
-            time_str = match.group(3).strip()
+            date_match = SLOT_DATE_RE.fullmatch(match.group(2).strip())
+            time_match = SLOT_TIME_RE.fullmatch(match.group(3).strip())
+            if not date_match or not time_match:
+                raise ValueError("Slot date or time format is incorrect.")
 
-            # Combine date and time and parse into a datetime object
-            # We need to add the current year to the date string for parsing
-            full_date_str = f"{date_str}, {datetime.now().year}"
-            dt_object = datetime.strptime(full_date_str + " " + time_str, "%A, %B %d, %Y %I:%M %p")
+            weekday, month_name, day = date_match.groups()
+            hour, minute, meridiem = time_match.groups()
+            month = MONTH_NUMBERS.get(month_name.lower())
+            hour, minute = int(hour), int(minute)
+            if weekday.lower() not in WEEKDAY_NAMES or month is None or not 1 <= hour <= 12 or minute > 59:
+                raise ValueError("Slot date or time format is incorrect.")
+
+            # 12-hour clock -> 24-hour clock; the slot string carries no year, so use the current one
+            hour = hour % 12 + (12 if meridiem.lower() == "pm" else 0)
+            appointment_date = date(datetime.now().year, month, int(day))
             
             return {
                 "doctor_name": doctor_name,
-                "appointment_date": dt_object.strftime("%Y-%m-%d"),
-                "appointment_time": dt_object.strftime("%H:%M:%S")
+                "appointment_date": appointment_date.isoformat(),
+                "appointment_time": f"{hour:02d}:{minute:02d}:00"
             }
         except Exception as e:
             print(f"Error parsing slot string: {e}")
@@ -77,19 +192,18 @@ class ExportTools:
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
         appointment_id = f"APP{timestamp}{patient_id[-4:]}"
 
-        new_appointment = {
-            "appointment_id": appointment_id,
-            "patient_id": patient_id,
-            "doctor_name": parsed_slot["doctor_name"],
-            "appointment_date": parsed_slot["appointment_date"],
-            "appointment_time": parsed_slot["appointment_time"],
-            "is_new_patient": is_new_patient,
-            "status": "Confirmed"
-        }
-        
-        # Append to the CSV file
-        df = pd.DataFrame([new_appointment])
-        df.to_csv(self.appointments_file, mode='a', header=False, index=False)
+        # Append to the CSV file (values in APPOINTMENT_COLUMNS order)
+        row = (
+            appointment_id,
+            patient_id,
+            parsed_slot["doctor_name"],
+            parsed_slot["appointment_date"],
+            parsed_slot["appointment_time"],
+            is_new_patient,
+            "Confirmed",
+        )
+        self._append_row(row)
+        self._log_appointments(pa.Table.from_pylist([dict(zip(APPOINTMENT_COLUMNS, row))], schema=APPOINTMENT_SCHEMA))
         
         print(f"✅ Appointment {appointment_id} booked successfully.")
         return appointment_id
@@ -102,29 +216,36 @@ class ExportTools:
             The filepath of the generated report.
         """
         try:
-            appointments_df = pd.read_csv(self.appointments_file)
-            patients_df = pd.read_csv(self.patients_file)
+            appointments_df = self._read_appointments_log()
+            patients_df = read_csv_arrow(self.patients_file, usecols=REPORT_PATIENT_COLUMNS)
+            # Only a handful of distinct values each, so store them as categories
+            appointments_df = appointments_df.astype({column: 'category' for column in REPORT_CATEGORY_COLUMNS})
             
             # Merge appointment data with patient data for a comprehensive report
             report_df = pd.merge(
                 appointments_df,
-                patients_df[['patient_id', 'first_name', 'last_name', 'phone', 'email']],
+                patients_df,
                 on='patient_id',
                 how='left'
             )
             
-            # Reorder columns for clarity
-            report_df = report_df[[
-                'appointment_id', 'patient_id', 'first_name', 'last_name',
-                'appointment_date', 'appointment_time', 'doctor_name', 
-                'status', 'is_new_patient', 'phone', 'email'
-            ]]
+            # Reorder columns for clarity; missing values become empty cells
+            report_df = report_df[list(REPORT_COLUMNS)].astype(object)
+            report_df = report_df.where(report_df.notna(), None)
             
             # Generate a unique filename for the report
             report_filename = f"admin_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+            # Ensure the exports directory exists (only needed once a report is written)
+            os.makedirs(self.exports_dir, exist_ok=True)
             report_filepath = os.path.join(self.exports_dir, report_filename)
             
-            report_df.to_excel(report_filepath, index=False)
+            # Stream rows into a write-only workbook instead of building every cell in memory
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet("Sheet1")
+            sheet.append(REPORT_COLUMNS)
+            for row in report_df.itertuples(index=False, name=None):
+                sheet.append(row)
+            workbook.save(report_filepath)
             print(f"📄 Admin report generated successfully at '{report_filepath}'.")
             return report_filepath
         except Exception as e:
@@ -133,11 +254,6 @@ class ExportTools:
 
 # --- Example Usage & Testing ---
 if __name__ == '__main__':
-    # --- FIX FOR DIRECT EXECUTION ---
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.dirname(current_dir)
-    sys.path.append(project_root)
-    # --- END FIX ---
 
     # --- LOCAL IMPORTS ---
     from config import settings
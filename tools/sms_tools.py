@@ -2,20 +2,32 @@
 # This tool handles sending SMS messages using the Twilio API.
 
 from twilio.rest import Client
+from twilio.http.http_client import TwilioHttpClient
+from concurrent.futures import ThreadPoolExecutor
+import aiohttp
+import json
 import sys
 import os
 
+TWILIO_MESSAGES_URL = "https://api.twilio.com/2010-04-01/Accounts/{account_sid}/Messages.json"
+
 class SMSTools:
-    def __init__(self, account_sid, auth_token, twilio_phone_number):
+    def __init__(self, account_sid, auth_token, twilio_phone_number, http_client=None):
         """
         Initializes the SMSTools with Twilio credentials.
+
+        Every send goes through one pooled HTTP session, so the TLS connection to
+        Twilio stays warm between messages. Pass a shared `http_client` (e.g. a
+        TwilioHttpClient) to reuse its connection pool across tools.
         """
         self.account_sid = account_sid
         self.auth_token = auth_token
         self.twilio_phone_number = twilio_phone_number
         
         if self.account_sid and self.auth_token:
-            self.client = Client(account_sid, auth_token)
+            if http_client is None:
+                http_client = TwilioHttpClient(pool_connections=True, max_retries=2)
+            self.client = Client(account_sid, auth_token, http_client=http_client)
         else:
             self.client = None
 
@@ -46,6 +58,74 @@ class SMSTools:
             print(f"❌ Failed to send SMS: {e}")
             return False
 
+    def send_sms_batch(self, items: list, max_workers: int = 8) -> list:
+        """
+        Sends many different messages concurrently. `items` are
+        (to_phone_number, message_body) tuples; returns one success flag per
+        item, in order. All workers share the client's pooled connections.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(lambda item: self.send_sms(*item), items))
+
+    def send_bulk_sms(self, to_phone_numbers: list, message_body: str, notify_service_sid: str = None) -> bool:
+        """
+        Sends the same message to several phone numbers.
+
+        With a Twilio Notify service this is a single API call that Twilio fans
+        out; otherwise (or for a single recipient) it falls back to send_sms.
+
+        Returns:
+            True if every message was accepted, False otherwise.
+        """
+        if not notify_service_sid or len(to_phone_numbers) < 2:
+            return all([self.send_sms(number, message_body) for number in to_phone_numbers])
+
+        if not self.client:
+            print("❌ Twilio client is not configured. Check your .env file. Cannot send SMS.")
+            return False
+
+        try:
+            notification = self.client.notify.v1.services(notify_service_sid).notifications.create(
+                to_binding=[json.dumps({"binding_type": "sms", "address": number}) for number in to_phone_numbers],
+                body=message_body
+            )
+            print(f"✅ Bulk SMS sent to {len(to_phone_numbers)} recipients (SID: {notification.sid})")
+            return True
+        except Exception as e:
+            print(f"❌ Failed to send bulk SMS: {e}")
+            return False
+
+    async def send_sms_async(self, session: aiohttp.ClientSession, to_phone_number: str, message_body: str) -> bool:
+        """
+        Async variant of send_sms that posts straight to the Twilio REST API.
+
+        Args:
+            session: A shared aiohttp session, so many sends reuse the same connections.
+            to_phone_number: The recipient's phone number in E.164 format (e.g., +1234567890).
+            message_body: The content of the SMS message.
+
+        Returns:
+            True if the message was sent successfully, False otherwise.
+        """
+        if not self.client:
+            print("❌ Twilio client is not configured. Check your .env file. Cannot send SMS.")
+            return False
+
+        try:
+            async with session.post(
+                TWILIO_MESSAGES_URL.format(account_sid=self.account_sid),
+                data={"Body": message_body, "From": self.twilio_phone_number, "To": to_phone_number},
+                auth=aiohttp.BasicAuth(self.account_sid, self.auth_token),
+            ) as response:
+                payload = await response.json()
+                if response.status >= 400:
+                    raise RuntimeError(payload.get("message", f"HTTP {response.status}"))
+            print(f"✅ SMS sent successfully to {to_phone_number} (SID: {payload.get('sid')})")
+            return True
+        except Exception as e:
+            print(f"❌ Failed to send SMS: {e}")
+            return False
+
 # --- Example Usage & Testing ---
 if __name__ == '__main__':
     # --- FIX FOR DIRECT EXECUTION ---
@@ -0,0 +1,128 @@
+# utils/frame_cache.py
+# Parquet copies of the CSV/Excel data files, so repeated loads skip parsing,
+# and a pyarrow-backed CSV reader for the parses that do happen.
+
+import hashlib
+import os
+import tempfile
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+# pyarrow would infer these ISO-formatted columns as date/time values; the rest of
+# the code compares and concatenates them as text, like pd.read_csv returns them.
+TEXT_COLUMNS = ("date_of_birth", "last_visit", "appointment_date", "appointment_time")
+
+
+def parquet_path_for(csv_path: str, key: str = "") -> str:
+    """data/patients.csv -> data/patients.parquet (data/patients.<key>.parquet with a key)"""
+    stem = os.path.splitext(csv_path)[0]
+    return f"{stem}.{key}.parquet" if key else stem + ".parquet"
+
+
+def _cache_key(prepare, options) -> str:
+    """
+    Short hash of everything that shapes the cached frame besides the source file,
+    so callers with a different `prepare` or read options get their own copy.
+    """
+    spec = repr((getattr(prepare, "__module__", None), getattr(prepare, "__qualname__", None), options))
+    return hashlib.blake2s(spec.encode(), digest_size=4).hexdigest()
+
+
+def read_csv_arrow(
+    csv_path: str,
+    usecols: Optional[Sequence[str]] = None,
+    arrow_strings: bool = False,
+) -> pd.DataFrame:
+    """
+    Parses a CSV with pyarrow's multithreaded reader.
+
+    The result matches pd.read_csv's defaults: TEXT_COLUMNS stay strings and
+    empty cells are NaN. With `arrow_strings`, text columns are instead kept in
+    Arrow memory as pandas' string[pyarrow] dtype (a fraction of the size of
+    Python str objects), and empty cells are pd.NA.
+    Raises FileNotFoundError if the file does not exist.
+    """
+    convert_options = pa_csv.ConvertOptions(
+        column_types={column: pa.string() for column in TEXT_COLUMNS},
+        include_columns=usecols,
+        strings_can_be_null=True,
+    )
+    table = pa_csv.read_csv(csv_path, convert_options=convert_options)
+    if arrow_strings:
+        return table.to_pandas(types_mapper={pa.string(): pd.StringDtype("pyarrow")}.get)
+
+    df = table.to_pandas()
+    text = df.columns[df.dtypes == object]
+    df[text] = df[text].fillna(np.nan)
+    return df
+
+
+def read_csv_cached(
+    csv_path: str,
+    prepare: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+    usecols: Optional[Sequence[str]] = None,
+) -> pd.DataFrame:
+    """
+    Reads `csv_path` through a Parquet copy stored next to it.
+
+    The Parquet file carries the mtime of the CSV it was built from and is rebuilt
+    whenever they differ, so appends to the CSV are always picked up. `prepare`
+    runs once on the freshly parsed CSV (e.g. dtype conversions) and its result is
+    what gets cached; each (`prepare`, `usecols`) pair has its own Parquet file.
+
+    Raises FileNotFoundError if the CSV does not exist, just like pd.read_csv.
+    """
+    options = tuple(usecols) if usecols is not None else None
+    return _read_through_parquet(
+        csv_path, lambda: read_csv_arrow(csv_path, usecols=usecols), prepare, _cache_key(prepare, options)
+    )
+
+
+def read_excel_cached(
+    excel_path: str,
+    prepare: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+    **read_excel_kwargs,
+) -> pd.DataFrame:
+    """Like read_csv_cached, for Excel files (where the parse is far slower)."""
+    options = tuple(sorted(read_excel_kwargs.items()))
+    return _read_through_parquet(
+        excel_path, lambda: pd.read_excel(excel_path, **read_excel_kwargs), prepare, _cache_key(prepare, options)
+    )
+
+
+def _read_through_parquet(source_path, load, prepare, key) -> pd.DataFrame:
+    # Taken before the parse: if the source changes while we read it, the copy is
+    # stamped with the old mtime and gets rebuilt on the next call.
+    source_mtime = os.stat(source_path).st_mtime_ns
+    parquet_path = parquet_path_for(source_path, key)
+
+    try:
+        if os.stat(parquet_path).st_mtime_ns == source_mtime:
+            return pd.read_parquet(parquet_path, engine="pyarrow", memory_map=True)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"⚠️ Ignoring unreadable cache {parquet_path}: {e}")
+
+    df = load()
+    if prepare is not None:
+        df = prepare(df)
+
+    # Written under a dot-name and renamed once complete, so readers never see a partial file.
+    directory, name = os.path.split(parquet_path)
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix="." + name, suffix=".tmp", dir=directory or ".")
+        os.close(fd)
+        df.to_parquet(tmp_path, engine="pyarrow", compression="zstd", index=False)
+        os.utime(tmp_path, ns=(source_mtime, source_mtime))
+        os.replace(tmp_path, parquet_path)
+    except Exception as e:
+        print(f"⚠️ Could not write cache {parquet_path}: {e}")
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return df
@@ -1,12 +1,17 @@
 # utils/helpers.py
 # Lightweight helpers for parsing and normalization.
 
-import re
-from datetime import datetime
+import calendar
+from datetime import date, datetime
 from typing import Optional
 
+try:
+    import re2 as email_re  # Optional: linear-time matching, no backtracking on hostile input.
+except ImportError:
+    import re as email_re
+
 # RFC 5322-inspired, simplified for practical use
-EMAIL_REGEX = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
+EMAIL_REGEX = email_re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
 
 def extract_email(text: str) -> Optional[str]:
     """
@@ -25,6 +30,16 @@ def normalize_name(full_name: Optional[str]) -> Optional[str]:
         return None
     return " ".join(full_name.split()).title()
 
+# Supported formats, grouped by the separator each one requires; a value is only
+# tried against the formats whose separator it actually contains.
+DATE_FORMATS_BY_SEPARATOR = (
+    ("-", ("%Y-%m-%d",)),
+    ("/", ("%m/%d/%Y", "%d/%m/%Y")),
+    (",", ("%B %d, %Y",    # e.g., September 08, 2025
+           "%b %d, %Y")),  # e.g., Sep 08, 2025
+    (".", ("%Y.%m.%d",)),
+)
+
 def parse_date_to_yyyy_mm_dd(value: Optional[str]) -> Optional[str]:
     """
     Parse common date formats and return YYYY-MM-DD or None.
@@ -32,18 +47,35 @@ def parse_date_to_yyyy_mm_dd(value: Optional[str]) -> Optional[str]:
     if not value:
         return None
     value = value.strip()
-    formats = [
-        "%Y-%m-%d",
-        "%m/%d/%Y",
-        "%d/%m/%Y",
-        "%B %d, %Y",   # e.g., September 08, 2025
-        "%b %d, %Y",   # e.g., Sep 08, 2025
-        "%Y.%m.%d",
-    ]
-    for fmt in formats:
+
+    # Fast path: already YYYY-MM-DD (the LLM is asked for this format)
+    if len(value) == 10 and value[4] == "-" and value[7] == "-":
         try:
-            dt = datetime.strptime(value, fmt)
-            return dt.strftime("%Y-%m-%d")
-        except Exception:
+            return date.fromisoformat(value).isoformat()
+        except ValueError:
+            pass
+
+    for separator, formats in DATE_FORMATS_BY_SEPARATOR:
+        if separator not in value:
             continue
-    return None
\ No newline at end of file
+        for fmt in formats:
+            try:
+                return datetime.strptime(value, fmt).strftime("%Y-%m-%d")
+            except ValueError:
+                continue
+    return None
+
+def iso_to_u32(value: Optional[str]) -> Optional[int]:
+    """
+    '1985-03-15' -> 19850315, or None unless `value` is exactly a valid YYYY-MM-DD date.
+    The integers order like the dates and are cheap to hash and compare.
+    """
+    if not value or len(value) != 10 or not value.isascii() or value[4] != "-" or value[7] != "-":
+        return None
+    year, month, day = value[0:4], value[5:7], value[8:10]
+    if not (year.isdigit() and month.isdigit() and day.isdigit()):
+        return None
+    year, month, day = int(year), int(month), int(day)
+    if not (1 <= year and 1 <= month <= 12 and 1 <= day <= calendar.monthrange(year, month)[1]):
+        return None
+    return year * 10000 + month * 100 + day
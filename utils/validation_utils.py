@@ -1,29 +1,46 @@
 import re
-from datetime import datetime, timedelta
+import time
+from datetime import date, datetime, timedelta
+
+from utils.helpers import iso_to_u32
+
+# Allow letters, spaces, hyphens, apostrophes only
+_NAME_RE = re.compile(r"^[a-zA-Z\s\-']+$")
+
+# (today as YYYYMMDD, epoch seconds of the next local midnight); refreshed once the day rolls over
+_today_cache = (0, 0.0)
+
+def _today_u32() -> int:
+    global _today_cache
+    today_u32, expires_at = _today_cache
+    if time.time() >= expires_at:
+        today = date.today()
+        today_u32 = today.year * 10000 + today.month * 100 + today.day
+        next_midnight = datetime.combine(today + timedelta(days=1), datetime.min.time())
+        _today_cache = (today_u32, next_midnight.timestamp())
+    return today_u32
 
 def validate_date_of_birth(dob_string: str) -> bool:
     """Validate DOB format and constraints"""
-    try:
-        dob = datetime.strptime(dob_string, '%Y-%m-%d')
-        today = datetime.now()
-        age = today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
-        
-        return (
-            dob.year >= 1900 and 
-            dob <= today and 
-            0 <= age <= 120
-        )
-    except ValueError:
-        return False
+    # Dates as YYYYMMDD integers: the difference's ten-thousands are whole years of age
+    dob_u32 = iso_to_u32(dob_string)
+    if dob_u32 is None:
+        # strptime also accepts non-padded forms such as 1985-3-5
+        try:
+            dob = datetime.strptime(dob_string, '%Y-%m-%d')
+        except ValueError:
+            return False
+        dob_u32 = dob.year * 10000 + dob.month * 100 + dob.day
+
+    today_u32 = _today_u32()
+    return 19000101 <= dob_u32 <= today_u32 and (today_u32 - dob_u32) // 10000 <= 120
 
 def validate_full_name(name: str) -> bool:
     """Validate full name format"""
     if not name or len(name.strip()) < 2:
         return False
     
-    # Allow letters, spaces, hyphens, apostrophes only
-    pattern = r"^[a-zA-Z\s\-']+$"
-    if not re.match(pattern, name):
+    if not _NAME_RE.match(name):
         return False
     
     # Must have at least first and last name
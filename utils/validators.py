@@ -5,21 +5,37 @@ import re
 from datetime import datetime
 from typing import Optional
 
-EMAIL_FULL_REGEX = re.compile(
-    r"^(?=.{1,254}$)[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}$"
+from utils.helpers import iso_to_u32
+
+import numpy as np
+import pandas as pd
+
+try:
+    import re2 as email_re  # Optional: linear-time matching, no backtracking on hostile input.
+except ImportError:
+    import re as email_re
+
+# The 254-character limit is checked in is_valid_email (re2 has no lookaheads).
+EMAIL_MAX_LENGTH = 254
+EMAIL_FULL_REGEX = email_re.compile(
+    r"^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}$"
 )
 
 def is_valid_email(value: Optional[str]) -> bool:
     if not value:
         return False
     v = value.strip()
-    return EMAIL_FULL_REGEX.match(v) is not None
+    return len(v) <= EMAIL_MAX_LENGTH and EMAIL_FULL_REGEX.match(v) is not None
 
 def is_valid_date_yyyy_mm_dd(value: Optional[str]) -> bool:
     if not value:
         return False
+    value = value.strip()
+    # Fast path for the zero-padded form; strptime also accepts e.g. 2025-9-8
+    if iso_to_u32(value) is not None:
+        return True
     try:
-        datetime.strptime(value.strip(), "%Y-%m-%d")
+        datetime.strptime(value, "%Y-%m-%d")
         return True
     except Exception:
         return False
@@ -32,4 +48,16 @@ def is_valid_full_name(value: Optional[str]) -> bool:
         return False
     # Ensure most characters are alphabetic; allow hyphens and apostrophes
     letters = re.sub(r"[^A-Za-z\-'\s]", "", value)
-    return len(letters.replace(" ", "")) >= max(3, int(0.8 * len(value.replace(" ", ""))))
\ No newline at end of file
+    return len(letters.replace(" ", "")) >= max(3, int(0.8 * len(value.replace(" ", ""))))
+
+def is_valid_full_name_series(names: pd.Series) -> pd.Series:
+    """
+    is_valid_full_name over a whole column at once, using pandas' string methods.
+    Missing values are invalid.
+    """
+    names = names.astype("string")
+    has_two_parts = names.str.split().str.len() >= 2
+    length = names.str.replace(" ", "", regex=False).str.len()
+    letters = names.str.replace(r"[^A-Za-z\-'\s]", "", regex=True).str.replace(" ", "", regex=False).str.len()
+    valid = has_two_parts & (letters >= np.maximum(3, np.floor(0.8 * length)))
+    return valid.fillna(False).astype(bool)